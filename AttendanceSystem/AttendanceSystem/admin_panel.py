@@ -1,6 +1,5 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
 import cv2
 import face_recognition
 import numpy as np
@@ -12,7 +11,12 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet
 from PIL import Image, ImageTk
-from config import DB_PATH, FACE_ENCODINGS_DIR, REPORTS_DIR, LOG_DIR
+from config import FACE_ENCODINGS_DIR, REPORTS_DIR, LOG_DIR, ADMIN_CAMERA_SOURCE, GALLERY_MAX_TEMPLATES
+from config import DETECTOR_BACKEND, DETECTOR_CASCADE_PATH, ADMIN_PREVIEW_FPS, ADMIN_PREVIEW_SCALE
+from detection import create_backend, PreviewDetector
+from camera import open_capture
+import database
+import metrics
 import logging
 
 class AdminPanel:
@@ -26,8 +30,10 @@ class AdminPanel:
         
         self.video_capture = None
         self.capture_active = False
-        self.face_encoding = None
+        self.face_templates = []
         self.temp_student_data = {}
+        self.face_detector = create_backend(DETECTOR_BACKEND, DETECTOR_CASCADE_PATH)
+        self.preview_detector = None
         
         self.create_widgets()
         self.load_students()
@@ -43,9 +49,7 @@ class AdminPanel:
         window.geometry(f'{width}x{height}+{x}+{y}')
 
     def cleanup(self):
-        self.capture_active = False
-        if self.video_capture and self.video_capture.isOpened():
-            self.video_capture.release()
+        self.cleanup_camera()
         self.window.destroy()
 
     def create_widgets(self):
@@ -121,15 +125,9 @@ class AdminPanel:
                 status_label.config(text="All fields are required", fg="red")
                 return
 
-            try:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                c.execute("SELECT 1 FROM students WHERE student_id=?", (student_id,))
-                if c.fetchone():
-                    status_label.config(text=f"ID {student_id} already exists", fg="red")
-                    return
-            finally:
-                conn.close()
+            if database.student_exists(student_id):
+                status_label.config(text=f"ID {student_id} already exists", fg="red")
+                return
 
             reg_window.destroy()
             self.temp_student_data = {'id': student_id, 'name': name}
@@ -139,6 +137,7 @@ class AdminPanel:
                  command=proceed_to_face_capture).pack(pady=10)
 
     def show_face_capture_interface(self):
+        self.face_templates = []
         self.capture_window = tk.Toplevel(self.window)
         self.capture_window.title("Face Capture")
         self.capture_window.geometry("800x600")
@@ -165,26 +164,33 @@ class AdminPanel:
         self.save_btn.pack(side=tk.LEFT, padx=10)
 
         # Initialize video capture
-        self.video_capture = cv2.VideoCapture(0)
-        if not self.video_capture.isOpened():
+        self.video_capture = open_capture(ADMIN_CAMERA_SOURCE, 640, 480)
+        if self.video_capture is None:
             self.capture_status.config(text="Error accessing camera", fg="red")
             return
 
-        self.video_capture.set(3, 640)  # Width
-        self.video_capture.set(4, 480)  # Height
+        # Detection runs off the Tk thread, a few times a second
+        self.preview_detector = PreviewDetector(self.face_detector, ADMIN_PREVIEW_FPS, ADMIN_PREVIEW_SCALE)
+        self.capture_window.protocol("WM_DELETE_WINDOW", self.close_capture)
         self.capture_active = True
         self.update_preview()
 
+    def close_capture(self):
+        self.cleanup_camera()
+        self.capture_window.destroy()
+
     def update_preview(self):
         if self.capture_active and self.video_capture.isOpened():
             ret, frame = self.video_capture.read()
             if ret:
+                self.preview_detector.submit(frame)
                 rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_locations = face_recognition.face_locations(rgb_frame)
-                
-                for (top, right, bottom, left) in face_locations:
+                # Boxes from the latest finished detection, which lags the
+                # live frame by at most one detection interval
+                detection = self.preview_detector.latest()
+                for (top, right, bottom, left) in detection.boxes if detection else ():
                     cv2.rectangle(rgb_frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                
+
                 img = Image.fromarray(rgb_frame)
                 imgtk = ImageTk.PhotoImage(image=img)
                 self.video_label.imgtk = imgtk
@@ -193,21 +199,20 @@ class AdminPanel:
             self.video_label.after(10, self.update_preview)
 
     def capture_face(self):
-        if not self.video_capture.isOpened():
+        if not self.video_capture or not self.video_capture.isOpened():
             self.capture_status.config(text="Camera not available", fg="red")
             return
 
-        ret, frame = self.video_capture.read()
-        if not ret:
-            self.capture_status.config(text="Error capturing frame", fg="red")
+        # Encode the frame the preview last detected on, with its boxes
+        detection = self.preview_detector.latest() if self.preview_detector else None
+        if detection is None:
+            self.capture_status.config(text="Waiting for face detection, try again", fg="red")
             return
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        rgb_frame = cv2.cvtColor(detection.frame, cv2.COLOR_BGR2RGB)
         
         try:
-            face_locations = face_recognition.face_locations(
-                rgb_frame, model="hog", number_of_times_to_upsample=2
-            )
+            face_locations = detection.boxes
             
             if len(face_locations) != 1:
                 error_msg = "No face detected" if len(face_locations) == 0 else "Multiple faces detected"
@@ -220,8 +225,15 @@ class AdminPanel:
             if not face_encodings:
                 raise ValueError("Failed to generate face encoding")
             
-            self.face_encoding = face_encodings[0]
-            self.capture_status.config(text="Face captured successfully!", fg="green")
+            self.face_templates.append(face_encodings[0])
+            captured = len(self.face_templates)
+            if captured >= GALLERY_MAX_TEMPLATES:
+                self.capture_btn.config(state=tk.DISABLED)
+                status = f"Captured {captured} samples"
+            else:
+                status = (f"Captured sample {captured} of {GALLERY_MAX_TEMPLATES}; "
+                          "change pose or lighting and capture again, or save")
+            self.capture_status.config(text=status, fg="green")
             self.save_btn.config(state=tk.NORMAL)
             
         except Exception as e:
@@ -231,19 +243,15 @@ class AdminPanel:
         try:
             os.makedirs(FACE_ENCODINGS_DIR, exist_ok=True)
             encoding_path = os.path.join(FACE_ENCODINGS_DIR, f"{self.temp_student_data['id']}.npy")
-            np.save(encoding_path, self.face_encoding)
+            templates = np.stack(self.face_templates)
+            np.save(encoding_path, templates)
 
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            c.execute(
-                "INSERT INTO students (name, student_id, face_encoding_path) VALUES (?, ?, ?)",
-                (self.temp_student_data['name'], self.temp_student_data['id'], encoding_path)
-            )
-            conn.commit()
+            database.add_student(self.temp_student_data['id'], self.temp_student_data['name'], encoding_path)
             messagebox.showinfo("Success", "Student registered successfully!")
             logging.info(f"New student registered: {self.temp_student_data['id']}")
             self.load_students()
-            self.main_app.load_encodings_cache()
+            self.main_app.register_encoding(self.temp_student_data['id'], templates,
+                                           self.temp_student_data['name'])
             self.capture_window.destroy()
 
         except Exception as e:
@@ -251,27 +259,22 @@ class AdminPanel:
             messagebox.showerror("Error", error_msg)
             logging.error(error_msg)
         finally:
-            if 'conn' in locals():
-                conn.close()
             self.cleanup_camera()
 
     def cleanup_camera(self):
         self.capture_active = False
+        if self.preview_detector:
+            self.preview_detector.stop()
+            self.preview_detector = None
         if self.video_capture and self.video_capture.isOpened():
             self.video_capture.release()
-        self.face_encoding = None
+        self.face_templates = []
 
     def load_students(self):
         try:
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            
             self.tree.delete(*self.tree.get_children())
-            c.execute("SELECT student_id, name FROM students ORDER BY student_id")
-            for row in c.fetchall():
+            for row in database.list_students():
                 self.tree.insert('', 'end', values=row)
-            
-            conn.close()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load students: {str(e)}")
             logging.error(f"Error loading students: {str(e)}")
@@ -286,22 +289,13 @@ class AdminPanel:
         
         if messagebox.askyesno("Confirm", f"Delete student {student_id}? This will also remove attendance records."):
             try:
-                conn = sqlite3.connect(DB_PATH)
-                c = conn.cursor()
-                
-                # Get encoding path
-                c.execute("SELECT face_encoding_path FROM students WHERE student_id=?", (student_id,))
-                result = c.fetchone()
-                if result and os.path.exists(result[0]):
-                    os.remove(result[0])
-                
-                # Delete records
-                c.execute("DELETE FROM students WHERE student_id=?", (student_id,))
-                c.execute("DELETE FROM attendance WHERE student_id=?", (student_id,))
-                conn.commit()
-                
+                # Delete records, then the encoding file they pointed to
+                encoding_path = database.delete_student(student_id)
+                if encoding_path and os.path.exists(encoding_path):
+                    os.remove(encoding_path)
+
                 self.load_students()
-                self.main_app.load_encodings_cache()
+                self.main_app.unregister_encoding(student_id)
                 message = f"Student {student_id} deleted successfully"
                 messagebox.showinfo("Success", message)
                 logging.info(message)
@@ -310,8 +304,6 @@ class AdminPanel:
                 error_msg = f"Deletion failed: {str(e)}"
                 messagebox.showerror("Error", error_msg)
                 logging.error(error_msg)
-            finally:
-                conn.close()
 
     def create_reports_tab(self):
         reports_tab = ttk.Frame(self.notebook)
@@ -352,24 +344,15 @@ class AdminPanel:
 
         try:
             os.makedirs(REPORTS_DIR, exist_ok=True)
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            
-            c.execute('''SELECT students.student_id, students.name, attendance.timestamp 
-                    FROM attendance JOIN students 
-                    ON attendance.student_id = students.student_id
-                    WHERE date=? AND lecture_number=? 
-                    ORDER BY timestamp''', (date, lecture_num))
-            
-            records = c.fetchall()
-            conn.close()
+            records = database.get_lecture_attendance(date, lecture_num)
 
             if not records:
                 messagebox.showinfo("Info", "No attendance records found")
                 return
 
             filename = os.path.join(REPORTS_DIR, f"attendance_{date}_lecture{lecture_num}.pdf")
-            self.create_pdf_report(filename, records, date, lecture_num)
+            with metrics.timer('report_pdf'):
+                self.create_pdf_report(filename, records, date, lecture_num)
             messagebox.showinfo("Success", f"Report generated:\n{filename}")
 
         except Exception as e:
@@ -433,32 +416,17 @@ class AdminPanel:
 
     def load_statistics(self):
         try:
-            conn = sqlite3.connect(DB_PATH)
-            c = conn.cursor()
-            
-            stats = {
-                'total_students': c.execute("SELECT COUNT(*) FROM students").fetchone()[0],
-                'today_attendance': c.execute("SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date=?", 
-                                            (datetime.now().date(),)).fetchone()[0],
-                'recent_lectures': c.execute('''SELECT date, lecture_number, COUNT(DISTINCT student_id) 
-                                              FROM attendance GROUP BY date, lecture_number 
-                                              ORDER BY date DESC LIMIT 5''').fetchall(),
-                'top_attendees': c.execute('''SELECT students.student_id, students.name, COUNT(*) 
-                                            FROM attendance JOIN students 
-                                            ON attendance.student_id = students.student_id 
-                                            GROUP BY students.student_id 
-                                            ORDER BY COUNT(*) DESC LIMIT 5''').fetchall()
-            }
-            conn.close()
+            with metrics.timer('statistics'):
+                stats = database.get_statistics(datetime.now().date())
 
             # Format statistics
-            stats_text = f"Total Students: {stats['total_students']}\n"
-            stats_text += f"Today's Attendance: {stats['today_attendance']}\n\n"
+            stats_text = f"Total Students: {stats.total_students}\n"
+            stats_text += f"Today's Attendance: {stats.today_attendance}\n\n"
             stats_text += "Recent Lectures:\n"
-            for date, lecture, count in stats['recent_lectures']:
+            for date, lecture, count in stats.recent_lectures:
                 stats_text += f"{date} - Lecture {lecture}: {count} students\n"
             stats_text += "\nTop Attendees:\n"
-            for sid, name, count in stats['top_attendees']:
+            for sid, name, count in stats.top_attendees:
                 stats_text += f"{name} ({sid}): {count} attendances\n"
 
             self.stats_text.delete(1.0, tk.END)
@@ -0,0 +1,180 @@
+import os
+import zlib
+import hashlib
+import logging
+import numpy as np
+from gallery import EMBEDDING_DIM, Match
+
+INDEX_VERSION = 2
+
+
+def gallery_fingerprint(gallery, count=None):
+    """Identify the first `count` template rows of a gallery (owners and embedding bytes)."""
+    count = gallery.n_templates if count is None else count
+    n_students = int(gallery.template_owners()[count - 1]) + 1 if count else 0
+    h = hashlib.sha256()
+    h.update('\0'.join(str(sid) for sid in gallery.student_ids[:n_students]).encode('utf-8'))
+    h.update(np.ascontiguousarray(gallery.offsets[:n_students], dtype='<i8').tobytes())
+    h.update(zlib.crc32(np.ascontiguousarray(gallery.encodings[:count])).to_bytes(4, 'little'))
+    return h.hexdigest()
+
+
+def _sq_distances(x, centroids, centroid_sq):
+    x_sq = np.einsum('ij,ij->i', x, x)
+    return x_sq[:, None] + centroid_sq[None, :] - 2.0 * (x @ centroids.T)
+
+
+def _assign(x, centroids, chunk=16384):
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), chunk):
+        block = x[start:start + chunk]
+        labels[start:start + chunk] = np.argmin(_sq_distances(block, centroids, centroid_sq), axis=1)
+    return labels
+
+
+def kmeans(x, n_clusters, n_iter=10, seed=0):
+    """Plain Lloyd's k-means in NumPy, used to train the coarse quantizer."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters from random points so every list is used
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over a FaceGallery snapshot.
+
+    Template embeddings are clustered around coarse centroids; a query
+    scans only the ``n_probe`` closest lists using a float16 copy of the
+    vectors and re-ranks the best ``rerank`` candidates with exact float32
+    distances, keeping each student's closest template. Rows appended to
+    the gallery after the index was built (same epoch) are matched exactly,
+    so enrollment does not require a rebuild.
+    """
+
+    def __init__(self, centroids, order, offsets, fingerprint, gallery=None):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self.order = np.asarray(order, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.fingerprint = fingerprint
+        self.size = len(self.order)
+        self.epoch = None
+        self.codes = None
+        if gallery is not None:
+            self.attach(gallery)
+
+    @classmethod
+    def build(cls, gallery, n_lists=None, n_iter=10, train_size=65536, seed=0):
+        n = gallery.n_templates
+        if n == 0:
+            raise ValueError("Cannot build an index over an empty gallery")
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(n))
+        n_lists = max(1, min(n_lists, n))
+
+        x = np.asarray(gallery.encodings, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        train = x if n <= train_size else x[rng.choice(n, train_size, replace=False)]
+        centroids = kmeans(train, n_lists, n_iter=n_iter, seed=seed)
+
+        labels = _assign(x, centroids)
+        order = np.argsort(labels, kind='stable')
+        offsets = np.searchsorted(labels[order], np.arange(n_lists + 1))
+        return cls(centroids, order, offsets, gallery_fingerprint(gallery), gallery)
+
+    def attach(self, gallery):
+        """Bind the index to a gallery snapshot whose leading rows it was built on."""
+        self.codes = np.asarray(gallery.encodings[:self.size], dtype=np.float32)[self.order].astype(np.float16)
+        self.epoch = gallery.epoch
+
+    def without_rows(self, start, end, gallery):
+        """Index for ``gallery``, the snapshot left after rows start:end were
+        removed from the one this index covers; no re-clustering.
+
+        The removed rows are dropped from their lists and later rows shift
+        down, so deleting a student costs O(N) instead of a k-means run.
+        """
+        keep = (self.order < start) | (self.order >= end)
+        order = self.order[keep]
+        order = np.where(order >= end, order - (end - start), order)
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))[keep]
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=len(self.centroids)))])
+        index = IVFIndex(self.centroids, order, offsets, gallery_fingerprint(gallery, len(order)))
+        index.codes = self.codes[keep]
+        index.epoch = gallery.epoch
+        return index
+
+    def covers(self, gallery):
+        return self.codes is not None and gallery.epoch == self.epoch and gallery.n_templates >= self.size
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, version=INDEX_VERSION, centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, fingerprint=self.fingerprint)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, gallery):
+        """Load a persisted index; returns None if it was built for other data."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                if int(data['version']) != INDEX_VERSION:
+                    return None
+                order = data['order']
+                if len(order) > gallery.n_templates or str(data['fingerprint']) != gallery_fingerprint(gallery, len(order)):
+                    return None
+                return cls(data['centroids'], order, data['offsets'], str(data['fingerprint']), gallery)
+        except (OSError, KeyError, ValueError) as e:
+            logging.error(f"Failed to load ANN index {path}: {str(e)}")
+            return None
+
+    def match(self, gallery, face_encodings, n_probe=8, rerank=32):
+        """Same contract as FaceGallery.match, answered from the index."""
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if len(probes) == 0:
+            return []
+        n_lists = len(self.centroids)
+        n_probe = max(1, min(n_probe, n_lists))
+        probe_lists = np.argpartition(
+            _sq_distances(probes, self.centroids, self.centroid_sq), n_probe - 1, axis=1
+        )[:, :n_probe]
+        tail = np.arange(self.size, gallery.n_templates)
+        owners = gallery.template_owners()
+
+        results = []
+        for probe, lists in zip(probes, probe_lists):
+            slots = np.concatenate([np.arange(self.offsets[l], self.offsets[l + 1]) for l in lists])
+            if len(slots) > rerank:
+                diff = self.codes[slots].astype(np.float32) - probe
+                approx = np.einsum('ij,ij->i', diff, diff)
+                slots = slots[np.argpartition(approx, rerank - 1)[:rerank]]
+            # Exact re-ranking on the float32 gallery, plus rows enrolled
+            # after the index was built
+            candidates = np.concatenate([self.order[slots], tail])
+            if len(candidates) == 0:
+                results.append(Match(-1, None, float('inf'), float('inf')))
+                continue
+            diff = gallery.encodings[candidates] - probe
+            exact = np.sqrt(np.einsum('ij,ij->i', diff, diff))
+            ranked = np.argsort(exact)
+            ranked_owners = owners[candidates[ranked]]
+            best = int(ranked_owners[0])
+            best_dist = float(exact[ranked[0]])
+            # The runner-up is the closest template of any other student
+            others = np.flatnonzero(ranked_owners != best)
+            second_dist = float(exact[ranked[others[0]]]) if len(others) else float('inf')
+            results.append(Match(best, gallery.student_ids[best], best_dist, second_dist - best_dist))
+        return results
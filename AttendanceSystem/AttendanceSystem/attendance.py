@@ -0,0 +1,212 @@
+"""Headless entry points.
+
+python -m attendance scan --source 0 [--lecture 3]
+python -m attendance enroll known_faces/
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import logging
+from config import LOG_DIR, CAMERA_SOURCES, ROOM_NAME, GALLERY_SNAPSHOT_PATH
+from config import DETECTOR_BACKEND, DETECTOR_CASCADE_PATH
+from config import ENROLL_WORKERS, ENROLL_BATCH_SIZE, ENROLL_MAX_IMAGE_SIDE, ENROLL_UPSAMPLE, ENROLL_NUM_JITTERS
+from database import init_db, get_student_encodings
+from scanner import Scanner
+from gallery import students_digest, load_snapshot, load_encoding_files, write_snapshot
+from enrollment import BulkEnroller, read_source
+from detection import create_backend
+import metrics
+
+
+def emit(event, **fields):
+    fields = {k: (None if isinstance(v, float) and not math.isfinite(v) else v) for k, v in fields.items()}
+    print(json.dumps({'event': event, **fields}), flush=True)
+
+
+class HeadlessScan:
+    """Drives one or more camera sessions and writes their marks.
+
+    All sessions share the Scanner's gallery; marks from every source go
+    through the Scanner's attendance writer, so there is exactly one DB
+    writer, and its acknowledgements are reported as 'recorded' events.
+    """
+
+    def __init__(self, scanner, sessions, lecture=None, report_faces=False):
+        self.scanner = scanner
+        self.sessions = sessions
+        # Lecture session the marks go to; None for a dry run
+        self.lecture = lecture
+        self.report_faces = report_faces
+        self.processed = 0
+        self.recorded = 0
+
+    def handle(self, session, result):
+        self.processed += 1
+        for face in result.faces:
+            if self.report_faces:
+                emit('face', source=str(session.source), frame=result.seq, student_id=face.student_id,
+                     distance=round(face.distance, 4), box=list(face.box), track_id=face.track_id)
+        for face in session.new_arrivals(result.faces):
+            if self.lecture:
+                self.scanner.record_attendance(face.student_id, self.lecture)
+            emit('mark', source=str(session.source), frame=result.seq, student_id=face.student_id,
+                 name=self.scanner.students.get(face.student_id),
+                 lecture=self.lecture.lecture_number if self.lecture else None,
+                 distance=round(face.distance, 4), queued=self.lecture is not None)
+
+    def report_acks(self):
+        for ack in self.scanner.attendance_writer.poll_acks():
+            self.recorded += ack.inserted
+            emit('recorded', student_id=ack.mark.student_id, lecture=ack.mark.lecture_number,
+                 date=ack.mark.date, inserted=ack.inserted, error=ack.error)
+
+    def run(self, duration=None):
+        for session in self.sessions:
+            session.start()
+        start = time.time()
+        try:
+            while duration is None or time.time() - start < duration:
+                # Video files end on their own; cameras run until interrupted
+                if all(session.finished for session in self.sessions):
+                    break
+                idle = True
+                for session in self.sessions:
+                    result = session.pipeline.results.get(timeout=0)
+                    if result is not None:
+                        idle = False
+                        self.handle(session, result)
+                self.report_acks()
+                if idle:
+                    time.sleep(0.01)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for session in self.sessions:
+                session.stop()
+            if self.lecture:
+                # Commits the last marks, then makes the final reports due
+                self.scanner.close_lecture(self.lecture).join()
+            self.report_acks()
+
+
+def cmd_scan(args):
+    init_db()
+    scanner = Scanner()
+    if not scanner.load_encodings_cache():
+        raise SystemExit("Failed to load face encodings")
+    if len(scanner.gallery_store) == 0:
+        raise SystemExit("No students registered in the system")
+    scanner.start_metrics_server()
+
+    sources = args.source or CAMERA_SOURCES
+    sessions = []
+    for source in sources:
+        session = scanner.open_session(source, stride=args.every)
+        if session is None:
+            raise SystemExit(f"Could not open video source: {source}")
+        sessions.append(session)
+
+    lecture = None
+    if not args.dry_run:
+        room = args.room or ROOM_NAME or ', '.join(str(source) for source in sources)
+        lecture = scanner.open_lecture(args.lecture, room)
+        emit('session', id=lecture.id, date=lecture.date, lecture=lecture.lecture_number, room=lecture.room)
+
+    scan = HeadlessScan(scanner, sessions, lecture, report_faces=args.faces)
+    start = time.time()
+    try:
+        scan.run(duration=args.duration)
+    finally:
+        # Waits for the final report builds
+        scanner.shutdown()
+
+    elapsed = time.time() - start
+    frames = sum(session.pipeline.frames for session in sessions)
+    marked = sorted(set().union(*(session.marked_students for session in sessions)))
+    emit('summary', sources=[str(source) for source in sources],
+         lecture=lecture.lecture_number if lecture else args.lecture, frames=frames,
+         processed=scan.processed, recorded=scan.recorded, skipped=sum(session.pipeline.skipped for session in sessions),
+         marked=marked, elapsed_s=round(elapsed, 3), fps=round(frames / elapsed, 2) if elapsed else None)
+    emit('metrics', **metrics.snapshot())
+
+
+def cmd_enroll(args):
+    init_db()
+    items = read_source(args.source)
+    enroller = BulkEnroller(workers=args.workers, batch_size=args.batch_size, max_side=ENROLL_MAX_IMAGE_SIDE,
+                            upsample=ENROLL_UPSAMPLE, num_jitters=ENROLL_NUM_JITTERS,
+                            backend=create_backend(DETECTOR_BACKEND, DETECTOR_CASCADE_PATH))
+    start = time.time()
+    processed = 0
+
+    def on_result(result):
+        nonlocal processed
+        processed += 1
+        if result.error:
+            emit('rejected', student_id=result.item.student_id, image=result.item.image_path, reason=result.error)
+        elif processed % 100 == 0:
+            emit('progress', processed=processed, enrolled=enroller.enrolled,
+                 elapsed_s=round(time.time() - start, 3))
+
+    try:
+        enroller.run(items, on_result)
+    except KeyboardInterrupt:
+        emit('interrupted', enrolled=enroller.enrolled)
+    finally:
+        # Rebuild the gallery snapshot once for everything that was committed
+        students = get_student_encodings()
+        digest = students_digest(students)
+        gallery = load_snapshot(GALLERY_SNAPSHOT_PATH, digest)
+        if gallery is None:
+            gallery = load_encoding_files(students)
+            try:
+                write_snapshot(GALLERY_SNAPSHOT_PATH, gallery, digest)
+            except OSError as e:
+                # The scanner rebuilds it on its next start
+                logging.error(f"Error saving gallery snapshot: {str(e)}")
+
+    elapsed = time.time() - start
+    emit('summary', source=args.source, total=len(items), enrolled=enroller.enrolled,
+         skipped=enroller.skipped, rejected=len(enroller.rejected), gallery_size=len(gallery),
+         elapsed_s=round(elapsed, 3), per_second=round(processed / elapsed, 2) if elapsed else None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='attendance', description="Headless attendance scanner and enrollment")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    scan = sub.add_parser('scan', help="Recognize faces from cameras or video files and mark attendance")
+    scan.add_argument('--source', nargs='+', help="Camera indices and/or video file paths "
+                                                  "(default: CAMERA_SOURCES from config)")
+    scan.add_argument('--lecture', type=int, help="Lecture number to mark "
+                                                  "(default: the next lecture of the day)")
+    scan.add_argument('--room', help="Room recorded on the lecture session (default: ROOM_NAME or the sources)")
+    scan.add_argument('--every', type=int, default=1, help="Only process every Nth frame")
+    scan.add_argument('--duration', type=float, help="Stop after this many seconds")
+    scan.add_argument('--faces', action='store_true', help="Also emit one JSON line per detected face")
+    scan.add_argument('--dry-run', action='store_true', help="Recognize only, do not write to the database")
+    scan.set_defaults(func=cmd_scan)
+
+    enroll = sub.add_parser('enroll', help="Enroll students from a folder of photos or a CSV manifest")
+    enroll.add_argument('source', help="Folder of <student_id>.jpg photos, or a CSV with "
+                                       "student_id,name,image_path columns")
+    enroll.add_argument('--workers', type=int, default=ENROLL_WORKERS,
+                        help="Encoding processes (default: one per core)")
+    enroll.add_argument('--batch-size', type=int, default=ENROLL_BATCH_SIZE,
+                        help="Students committed per transaction")
+    enroll.set_defaults(func=cmd_enroll)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        filename=os.path.join(LOG_DIR, 'attendance.log'),
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import queue
+import sqlite3
+import threading
+import time
+import logging
+from collections import namedtuple
+from datetime import datetime
+import database
+import metrics
+
+# One attendance mark waiting to be written. The timestamp is taken when
+# the face is recognized, not when the batch reaches the database; date and
+# lecture_number come from the lecture session the mark belongs to.
+Mark = namedtuple('Mark', ['student_id', 'date', 'lecture_number', 'timestamp', 'session_id'])
+
+# Durable outcome of a mark: inserted is False when the row already existed,
+# error is set (and inserted False) when the batch could not be committed.
+Ack = namedtuple('Ack', ['mark', 'inserted', 'error'])
+
+
+class AttendanceWriter:
+    """Write-behind attendance writer with one long-lived connection.
+
+    Recognition threads call ``submit`` and return immediately. A single
+    writer thread drains the queue and commits up to ``batch_size`` marks
+    per transaction with ``INSERT OR IGNORE``; the
+    UNIQUE(student_id, date, lecture_number) constraint turns duplicates
+    into no-ops, so no existence check is needed. The outcome of every mark
+    is posted to ``acks`` once its transaction is committed, and
+    ``on_commit`` (if given) is called on the writer thread with the marks
+    that were actually inserted.
+    """
+
+    def __init__(self, batch_size=64, flush_interval=0.2, on_commit=None):
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.acks = queue.Queue()
+        self._marks = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='attendance-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, student_id, session):
+        mark = Mark(str(student_id), session.date, session.lecture_number,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session.id)
+        self._marks.put(mark)
+        metrics.count('marks_submitted')
+        return mark
+
+    def poll_acks(self):
+        """Return every acknowledgement posted so far without blocking"""
+        acks = []
+        while True:
+            try:
+                acks.append(self.acks.get_nowait())
+            except queue.Empty:
+                return acks
+
+    @property
+    def pending(self):
+        return self._marks.unfinished_tasks
+
+    def flush(self, timeout=None):
+        """Wait until every submitted mark is committed; returns False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._marks.unfinished_tasks and self._thread.is_alive():
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+        return not self._marks.unfinished_tasks
+
+    def close(self, timeout=5.0):
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self._marks.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        # Give a rush of arrivals a moment to share the transaction
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._marks.get(timeout=max(0.0, deadline - time.time())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            with metrics.timer('db_insert'):
+                inserted = database.insert_attendance(batch)
+        except sqlite3.Error as e:
+            logging.error(f"Failed to write {len(batch)} attendance marks: {str(e)}")
+            metrics.count('marks_failed', len(batch))
+            return [Ack(mark, False, str(e)) for mark in batch]
+        metrics.count('marks_inserted', sum(inserted))
+        metrics.count('marks_duplicate', len(inserted) - sum(inserted))
+
+        for mark, was_inserted in zip(batch, inserted):
+            if was_inserted:
+                logging.info(f"Attendance marked for {mark.student_id} (lecture {mark.lecture_number})")
+        return [Ack(mark, was_inserted, None) for mark, was_inserted in zip(batch, inserted)]
+
+    def _run(self):
+        try:
+            # Keep going after stop until everything submitted is written
+            while not (self._stop.is_set() and self._marks.empty()):
+                batch = self._next_batch()
+                if not batch:
+                    continue
+                acks = self._write(batch)
+                for ack in acks:
+                    self.acks.put(ack)
+                inserted = [ack.mark for ack in acks if ack.inserted]
+                if inserted and self.on_commit:
+                    try:
+                        self.on_commit(inserted)
+                    except Exception as e:
+                        logging.error(f"Attendance commit callback failed: {str(e)}")
+                for _ in batch:
+                    self._marks.task_done()
+        finally:
+            database.close_connection()
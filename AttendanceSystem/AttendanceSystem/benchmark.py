@@ -0,0 +1,430 @@
+"""Offline benchmarks: python benchmark.py {detect,match,ann,attendance,reports,suite} [options]
+
+Every benchmark runs on recorded video or generated data and never touches
+the real database or reports folder. Results are printed as JSON lines (and
+appended to --output), preceded by an environment record, so runs from
+different releases can be compared.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import date, timedelta
+import cv2
+import numpy as np
+from gallery import FaceGallery, EMBEDDING_DIM
+from ann_index import IVFIndex
+import database
+from attendance_writer import AttendanceWriter, Mark
+
+
+def synthetic_gallery(n, n_identities_per_cluster=50, noise=0.15, seed=0, templates=1):
+    """Clustered unit-scale embeddings that behave roughly like face encodings."""
+    rng = np.random.default_rng(seed)
+    n_clusters = max(1, n // n_identities_per_cluster)
+    centers = rng.normal(0, 1, (n_clusters, EMBEDDING_DIM)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    labels = rng.integers(0, n_clusters, n)
+    # float32 throughout so a 1M gallery fits in memory
+    encodings = rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)
+    encodings *= noise
+    encodings += centers[labels]
+    if templates > 1:
+        # Per-sample variation (pose, lighting) around each student's encoding
+        encodings = np.repeat(encodings, templates, axis=0)
+        encodings += rng.standard_normal(encodings.shape, dtype=np.float32) * (noise / 3)
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True) / 0.6
+    return FaceGallery([f"S{i:07d}" for i in range(n)], encodings,
+                       offsets=np.arange(0, n * templates + 1, templates))
+
+
+def genuine_probes(gallery, n_probes, noise=0.02, seed=1):
+    """Probes that are noisy copies of enrolled students' templates."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(gallery.n_templates, n_probes, replace=False)
+    probes = gallery.encodings[rows] + rng.normal(0, noise, (n_probes, EMBEDDING_DIM)).astype(np.float32)
+    return probes
+
+
+def latency(seconds):
+    """Mean, median and p95 of a list of durations, in milliseconds."""
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    return {
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+    }
+
+
+def environment():
+    """Identifies the code and machine a result file came from."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'benchmark': 'environment',
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def use_scratch_database(directory):
+    """Point the data-access layer at a fresh database under directory."""
+    database.close_connection()
+    database.DB_PATH = os.path.join(directory, 'benchmark.db')
+    database.init_db()
+
+
+def read_frames(path, count, resolution=None):
+    """Decode up to count frames of a recorded video up front, so decoding is not timed."""
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise SystemExit(f"Could not open video: {path}")
+    frames = []
+    try:
+        while len(frames) < count:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            if resolution:
+                frame = cv2.resize(frame, resolution, interpolation=cv2.INTER_AREA)
+            frames.append(frame)
+    finally:
+        capture.release()
+    if not frames:
+        raise SystemExit(f"No frames could be read from {path}")
+    return frames
+
+
+def bench_detect(args):
+    # dlib is only needed by this benchmark
+    import face_recognition
+    from detection import FaceDetector, create_backend
+
+    for resolution in args.resolutions or [None]:
+        frames = read_frames(args.video, args.frames, resolution)
+        height, width = frames[0].shape[:2]
+        for backend, scale, coarse_scale in itertools.product(args.backends, args.scales, args.coarse_scales):
+            detector = FaceDetector(create_backend(backend, args.cascade), scale=scale, upsample=args.upsample,
+                                    roi=args.roi, coarse_scale=coarse_scale or None,
+                                    coarse_backend=create_backend(backend, args.cascade, args.coarse_threshold))
+            resize_s, detect_s, encode_s, pixels, faces = [], [], [], [], 0
+            for frame in frames:
+                start = time.perf_counter()
+                prepared = detector.prepare(frame)
+                resized = time.perf_counter()
+                face_locations = detector.locate(prepared)
+                detected = time.perf_counter()
+                face_recognition.face_encodings(prepared.rgb, face_locations)
+                encoded = time.perf_counter()
+                resize_s.append(resized - start)
+                detect_s.append(detected - resized)
+                encode_s.append(encoded - detected)
+                pixels.append(detector.last_pixels)
+                faces += len(face_locations)
+            total_s = np.sum(resize_s) + np.sum(detect_s) + np.sum(encode_s)
+            # What a single full-frame pass at this scale would scan
+            full_pixels = int(width * scale) * int(height * scale) * 4 ** args.upsample
+            yield {
+                'benchmark': 'detect',
+                'backend': detector.backend.name,
+                'frame_size': f"{width}x{height}",
+                'scale': scale,
+                'coarse_scale': detector.coarse_scale,
+                'roi': args.roi,
+                'detect_size': f"{prepared.rgb.shape[1]}x{prepared.rgb.shape[0]}",
+                'frames': len(frames),
+                'faces_per_frame': faces / len(frames),
+                'pixels_per_frame': float(np.mean(pixels)),
+                'pixel_reduction': float(full_pixels / max(np.mean(pixels), 1)),
+                'resize': latency(resize_s),
+                'detection': latency(detect_s),
+                'encoding': latency(encode_s),
+                'encode_ms_per_face': float(np.sum(encode_s) * 1000 / faces) if faces else None,
+                'fps': float(len(frames) / total_s),
+            }
+
+
+def bench_match(args):
+    rng = np.random.default_rng(2)
+    for n in args.sizes:
+        start = time.perf_counter()
+        gallery = synthetic_gallery(n, templates=args.templates)
+        build_s = time.perf_counter() - start
+        probes = genuine_probes(gallery, min(gallery.n_templates, args.faces * args.repeats))
+
+        gallery.match(probes[:args.faces])  # warm-up
+        frame_s = []
+        for _ in range(args.repeats):
+            frame = probes[rng.choice(len(probes), min(args.faces, len(probes)), replace=False)]
+            start = time.perf_counter()
+            gallery.match(frame)
+            frame_s.append(time.perf_counter() - start)
+        yield {
+            'benchmark': 'match',
+            'gallery_size': n,
+            'templates_per_student': args.templates,
+            'faces_per_frame': args.faces,
+            'gallery_mb': (gallery.encodings.nbytes + gallery.sq_norms.nbytes) / 2 ** 20,
+            'build_s': build_s,
+            'per_frame': latency(frame_s),
+            'ms_per_face': float(np.mean(frame_s) * 1000 / args.faces),
+        }
+        del gallery, probes
+
+
+def bench_ann(args):
+    for n in args.sizes:
+        gallery = synthetic_gallery(n)
+        probes = genuine_probes(gallery, args.probes)
+
+        start = time.perf_counter()
+        exact = gallery.match(probes)
+        exact_ms = (time.perf_counter() - start) * 1000 / len(probes)
+
+        start = time.perf_counter()
+        index = IVFIndex.build(gallery)
+        build_s = time.perf_counter() - start
+
+        for n_probe in args.n_probe:
+            start = time.perf_counter()
+            approx = index.match(gallery, probes, n_probe=n_probe, rerank=args.rerank)
+            ann_ms = (time.perf_counter() - start) * 1000 / len(probes)
+            recall = np.mean([a.index == e.index for a, e in zip(approx, exact)])
+            yield {
+                'benchmark': 'ann',
+                'gallery_size': n,
+                'n_lists': len(index.centroids),
+                'n_probe': n_probe,
+                'rerank': args.rerank,
+                'recall_at_1': float(recall),
+                'exact_ms_per_face': exact_ms,
+                'ann_ms_per_face': ann_ms,
+                'build_s': build_s,
+            }
+
+
+def enroll_synthetic_students(n):
+    rows = [(f"S{i:07d}", f"Student {i}", f"S{i:07d}.npy") for i in range(n)]
+    database.add_students(rows)
+    return [row[0] for row in rows]
+
+
+def bench_attendance(args):
+    """Marks per second through the write-behind writer that mark_attendance submits to."""
+    with tempfile.TemporaryDirectory() as directory:
+        use_scratch_database(directory)
+        student_ids = enroll_synthetic_students(args.students)
+        today = date.today().isoformat()
+        for batch_size in args.batch_sizes:
+            # A fresh lecture per run so every mark is a real insert, then the
+            # same marks again, which the UNIQUE constraint turns into no-ops
+            session = database.open_lecture_session(today)
+            for phase in ('insert', 'duplicate'):
+                writer = AttendanceWriter(batch_size, args.flush_interval)
+                start = time.perf_counter()
+                for student_id in student_ids:
+                    writer.submit(student_id, session)
+                writer.flush()
+                elapsed = time.perf_counter() - start
+                writer.close()
+                acks = writer.poll_acks()
+                yield {
+                    'benchmark': 'attendance',
+                    'phase': phase,
+                    'batch_size': batch_size,
+                    'marks': len(student_ids),
+                    'inserted': sum(ack.inserted for ack in acks),
+                    'errors': sum(ack.error is not None for ack in acks),
+                    'seconds': elapsed,
+                    'marks_per_s': len(student_ids) / elapsed,
+                }
+        database.close_connection()
+
+
+def synthetic_history(student_ids, days, lectures, rate, seed=3):
+    """Attendance for `lectures` sessions a day over the last `days` days; returns (rows, last lecture)."""
+    rng = np.random.default_rng(seed)
+    first = date.today() - timedelta(days=days - 1)
+    rows = 0
+    for day in range(days):
+        day_str = (first + timedelta(days=day)).isoformat()
+        for lecture in range(1, lectures + 1):
+            session = database.open_lecture_session(day_str, lecture_number=lecture)
+            present = np.flatnonzero(rng.random(len(student_ids)) < rate)
+            timestamp = f"{day_str} {8 + lecture:02d}:00:00"
+            database.insert_attendance([Mark(student_ids[i], day_str, lecture, timestamp, session.id)
+                                        for i in present])
+            database.close_lecture_session(session.id)
+            rows += len(present)
+    return rows, (day_str, lectures)
+
+
+def timed(fn, repeats):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        seconds.append(time.perf_counter() - start)
+    return latency(seconds)
+
+
+def bench_reports(args):
+    with tempfile.TemporaryDirectory() as directory:
+        use_scratch_database(directory)
+        student_ids = enroll_synthetic_students(args.students)
+        start = time.perf_counter()
+        rows, (last_date, last_lecture) = synthetic_history(student_ids, args.days, args.lectures, args.rate)
+        history_s = time.perf_counter() - start
+
+        rng = np.random.default_rng(4)
+        sample = [student_ids[i] for i in rng.choice(len(student_ids), args.repeats)]
+        queries = {
+            'lecture_report_query': lambda: database.get_lecture_attendance(last_date, last_lecture),
+            'statistics': lambda: database.get_statistics(date.today()),
+            'student_history': lambda: database.get_student_history(sample[rng.integers(len(sample))]),
+        }
+        result = {
+            'benchmark': 'reports',
+            'students': args.students,
+            'days': args.days,
+            'lectures_per_day': args.lectures,
+            'attendance_rows': rows,
+            'history_rows_per_s': rows / history_s,
+        }
+        for name, query in queries.items():
+            result[name] = timed(query, args.repeats)
+
+        # The PDF report needs reportlab and the scanner's dependencies
+        try:
+            import scanner
+        except ImportError as e:
+            result['pdf_report'] = {'skipped': str(e)}
+        else:
+            # Reports and the metrics dumped on shutdown stay in the scratch directory
+            scanner.REPORTS_DIR = directory
+            scanner.METRICS_SNAPSHOT_PATH = os.path.join(directory, 'metrics.json')
+            engine = scanner.Scanner()
+            try:
+                result['pdf_report'] = timed(
+                    lambda: engine.generate_attendance_report(last_date, last_lecture), args.pdf_repeats)
+            except Exception as e:
+                result['pdf_report'] = {'skipped': str(e)}
+            finally:
+                engine.shutdown()
+        yield result
+        database.close_connection()
+
+
+def bench_suite(args):
+    """Everything that runs on generated data, plus detection when a video is given."""
+    if args.video:
+        yield from bench_detect(args)
+    yield from bench_match(args)
+    yield from bench_attendance(args)
+    yield from bench_reports(args)
+
+
+def add_detect_arguments(parser, required=True):
+    parser.add_argument('--video', required=required, help="Recorded video to detect faces in")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.25, 0.5])
+    parser.add_argument('--upsample', type=int, default=1)
+    parser.add_argument('--backends', nargs='+', default=['hog'],
+                        help="Detector backends to compare: hog, haar, lbp, haar+hog, lbp+hog")
+    parser.add_argument('--cascade', help="Cascade XML for the haar/lbp backends (default: OpenCV's bundled file)")
+    parser.add_argument('--coarse-scales', type=float, nargs='+', default=[0, 0.25],
+                        help="Coarse pass scales to compare; 0 scans the whole ROI at --scales")
+    parser.add_argument('--coarse-threshold', type=float, default=0.0)
+    parser.add_argument('--roi', type=float, nargs=4, metavar=('X0', 'Y0', 'X1', 'Y1'),
+                        help="Door region in fractions of the frame (default: whole frame)")
+    parser.add_argument('--resolutions', type=lambda s: tuple(int(v) for v in s.split('x')), nargs='+',
+                        help="Resize frames to these WIDTHxHEIGHT sizes first (default: as recorded)")
+
+
+def add_match_arguments(parser):
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000, 1000000])
+    parser.add_argument('--templates', type=int, default=1, help="Templates per student")
+    parser.add_argument('--faces', type=int, default=4, help="Faces matched per frame")
+    parser.add_argument('--repeats', type=int, default=20)
+
+
+def add_attendance_arguments(parser):
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 64])
+    parser.add_argument('--flush-interval', type=float, default=0.0,
+                        help="Writer wait for a batch to fill; 0 measures raw throughput")
+
+
+def add_reports_arguments(parser):
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--lectures', type=int, default=4, help="Lectures per day")
+    parser.add_argument('--rate', type=float, default=0.8, help="Share of students at each lecture")
+    parser.add_argument('--pdf-repeats', type=int, default=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance system benchmarks")
+    parser.add_argument('--output', help="Also append the JSON lines to this file")
+    sub = parser.add_subparsers(dest='benchmark', required=True)
+
+    detect = sub.add_parser('detect', help="Detection and encoding throughput on a recorded video")
+    add_detect_arguments(detect)
+    detect.set_defaults(func=bench_detect)
+
+    match = sub.add_parser('match', help="Matching latency against synthetic galleries")
+    add_match_arguments(match)
+    match.set_defaults(func=bench_match)
+
+    ann = sub.add_parser('ann', help="ANN index recall@1 and latency vs brute force")
+    ann.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    ann.add_argument('--probes', type=int, default=200)
+    ann.add_argument('--n-probe', type=int, nargs='+', default=[1, 4, 8, 16])
+    ann.add_argument('--rerank', type=int, default=32)
+    ann.set_defaults(func=bench_ann)
+
+    attendance = sub.add_parser('attendance', help="Attendance mark insert throughput")
+    add_attendance_arguments(attendance)
+    attendance.set_defaults(func=bench_attendance)
+
+    reports = sub.add_parser('reports', help="Report and statistics time over a synthetic history")
+    reports.add_argument('--students', type=int, default=500)
+    reports.add_argument('--repeats', type=int, default=50)
+    add_reports_arguments(reports)
+    reports.set_defaults(func=bench_reports)
+
+    suite = sub.add_parser('suite', help="Run detect (with --video), match, attendance and reports")
+    add_detect_arguments(suite, required=False)
+    add_match_arguments(suite)
+    add_attendance_arguments(suite)
+    add_reports_arguments(suite)
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    output = open(args.output, 'a') if args.output else None
+    try:
+        for result in itertools.chain([environment()], args.func(args)):
+            line = json.dumps(result)
+            print(line)
+            if output:
+                output.write(line + '\n')
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
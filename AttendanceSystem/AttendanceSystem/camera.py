@@ -0,0 +1,27 @@
+import os
+import cv2
+
+
+def parse_source(source):
+    """Camera indices may come from the command line or config as strings."""
+    if isinstance(source, str) and source.isdigit():
+        return int(source)
+    return source
+
+
+def is_live(source):
+    """Only local video files are replayed; indices and rtsp:// or http:// URLs are live cameras."""
+    source = parse_source(source)
+    return not (isinstance(source, str) and os.path.isfile(source))
+
+
+def open_capture(source, width=None, height=None):
+    """Open a camera index or video file; returns None if it cannot be opened."""
+    capture = cv2.VideoCapture(parse_source(source))
+    if not capture.isOpened():
+        capture.release()
+        return None
+    if width and height and is_live(source):
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return capture
@@ -7,6 +7,133 @@ FACE_ENCODINGS_DIR = os.path.join(BASE_DIR, 'face_encodings')
 REPORTS_DIR = os.path.join(BASE_DIR, 'reports')
 LOG_DIR = os.path.join(BASE_DIR, 'logs')  # Add this line for logging directory
 
+# Face matching: a probe is accepted when its best gallery distance is below this
+MATCH_TOLERANCE = 0.5
+
+# Packed, memory-mapped copy of every known encoding (rebuilt when students change)
+GALLERY_SNAPSHOT_PATH = os.path.join(FACE_ENCODINGS_DIR, 'gallery.snapshot')
+# Registrations only mark it dirty; it is rewritten this many seconds after
+# the last one (and on shutdown), so a burst of enrollments costs one write
+GALLERY_SNAPSHOT_DEBOUNCE = 2.0
+
+# Face templates kept per student; the admin panel captures up to this many
+# samples (vary pose and lighting between them) and matching uses the closest
+GALLERY_MAX_TEMPLATES = 5
+
+# Approximate nearest-neighbour (IVF) index for very large galleries.
+# Below ANN_MIN_GALLERY_SIZE the exact brute-force match is used.
+ANN_ENABLED = False
+ANN_MIN_GALLERY_SIZE = 20000
+ANN_INDEX_PATH = os.path.join(FACE_ENCODINGS_DIR, 'gallery.ivf.npz')
+ANN_N_LISTS = None  # None picks ~4 * sqrt(N) coarse clusters
+ANN_N_PROBE = 8  # Lists scanned per face: higher means better recall, more latency
+ANN_RERANK = 32  # Candidates re-ranked with exact float32 distances
+ANN_RETRY_INTERVAL = 300.0  # Seconds before a failed index build is tried again
+
+# Upper bound on how often the recognition worker processes a frame
+RECOGNITION_FPS = 3
+
+# Worker processes for detection and encoding; 0 or 1 keeps recognition on a
+# single thread. When using several workers raise RECOGNITION_FPS as well.
+RECOGNITION_WORKERS = 0
+
+# Face detector used by the scanner, the admin preview and enrollment: 'hog'
+# (dlib), 'haar' or 'lbp' (OpenCV cascades: faster, more false positives), or
+# 'haar+hog' / 'lbp+hog' where the cascade proposes and HOG confirms. The Haar
+# cascade ships with opencv-python; LBP needs DETECTOR_CASCADE_PATH pointing
+# at e.g. lbpcascade_frontalface_improved.xml from the OpenCV sources.
+DETECTOR_BACKEND = 'hog'
+DETECTOR_CASCADE_PATH = None
+
+# Face detection. Each camera frame is first cut down to DETECTION_ROI: None
+# for the whole frame, a rectangle (x0, y0, x1, y1) or a polygon
+# [(x, y), ...] in fractions of the frame, or a {source: roi} dict for
+# several doors. Pixels outside it are never resized or scanned.
+DETECTION_ROI = None
+# Faces are located and encoded at DETECTION_SCALE of the camera resolution.
+# HOG finds faces down to ~80 scaled pixels, ~40 with one upsample.
+DETECTION_SCALE = 0.5
+DETECTION_UPSAMPLE = 1
+# Coarse-to-fine: the ROI is scanned at DETECTION_COARSE_SCALE, and the
+# DETECTION_SCALE pass only runs around its candidates (grown by
+# DETECTION_REFINE_MARGIN of their size) and where the frame changed since
+# the previous one. None scans the whole ROI at DETECTION_SCALE.
+DETECTION_COARSE_SCALE = 0.25
+DETECTION_COARSE_UPSAMPLE = 1
+DETECTION_COARSE_THRESHOLD = -0.3  # Below 0 also proposes weak faces for refinement
+DETECTION_REFINE_MARGIN = 0.5
+
+# Face tracking: identified faces keep their identity on an IoU track and are
+# only re-encoded every TRACK_REVERIFY_INTERVAL seconds (single-worker mode)
+TRACKING_ENABLED = True
+TRACK_IOU_THRESHOLD = 0.3
+TRACK_MAX_AGE = 1.0  # Seconds a track survives without a matching detection
+TRACK_REVERIFY_INTERVAL = 5.0
+TRACK_UNKNOWN_RETRY = 1.0  # Seconds between encoding attempts for unknown faces
+
+# Motion gate: face detection only runs when enough of a small grayscale
+# thumbnail changes; after MOTION_IDLE_TIMEOUT seconds without motion the
+# scanner only checks one frame every MOTION_IDLE_POLL_INTERVAL seconds
+MOTION_GATE_ENABLED = True
+MOTION_THRESHOLD = 25  # Per-pixel gray-level change that counts as motion
+MOTION_MIN_AREA = 0.01  # Fraction of changed pixels needed to trigger detection
+MOTION_HOLD = 2.0  # Seconds detection keeps running after motion stops
+MOTION_IDLE_TIMEOUT = 60.0
+MOTION_IDLE_POLL_INTERVAL = 1.0
+
+# Cameras: indices or video file paths. The scanner opens every entry of
+# CAMERA_SOURCES and shares one gallery between them.
+CAMERA_SOURCES = [0]
+ADMIN_CAMERA_SOURCE = 0
+
+# Admin registration preview: faces are detected in the background at most
+# ADMIN_PREVIEW_FPS times a second on frames shrunk by ADMIN_PREVIEW_SCALE,
+# and "Capture Face" encodes the frame of the latest detection
+ADMIN_PREVIEW_FPS = 4
+ADMIN_PREVIEW_SCALE = 0.5
+
+# Room recorded on lecture sessions opened by this kiosk; None records the
+# camera sources instead
+ROOM_NAME = None
+
+# SQLite: each thread keeps one connection in WAL mode; writers wait up to
+# DB_BUSY_TIMEOUT seconds for a lock before failing
+DB_BUSY_TIMEOUT = 5.0
+DB_STATEMENT_CACHE_SIZE = 128
+
+# Bulk enrollment (python -m attendance enroll): photos are shrunk to at most
+# ENROLL_MAX_IMAGE_SIDE pixels before detection, and students are committed
+# ENROLL_BATCH_SIZE at a time. ENROLL_WORKERS = None uses every core.
+ENROLL_WORKERS = None
+ENROLL_BATCH_SIZE = 200
+ENROLL_MAX_IMAGE_SIDE = 1024
+ENROLL_UPSAMPLE = 1
+ENROLL_NUM_JITTERS = 1
+
+# Attendance marks are queued and committed by one writer thread in batches of
+# up to ATTENDANCE_WRITE_BATCH, waiting at most ATTENDANCE_FLUSH_INTERVAL
+# seconds for a batch to fill
+ATTENDANCE_WRITE_BATCH = 64
+ATTENDANCE_FLUSH_INTERVAL = 0.2
+
+# Lecture PDF reports are rebuilt in the background this many seconds after
+# the last new mark for the lecture, and once more when the scan stops.
+# A steady stream of arrivals still gets the report rebuilt at least every
+# REPORT_MAX_WAIT seconds
+REPORT_DEBOUNCE = 10.0
+REPORT_MAX_WAIT = 60.0
+
+# Hot-path instrumentation: per-stage latency histograms and counters,
+# dumped as JSON every METRICS_DUMP_INTERVAL seconds (0 = only on exit)
+METRICS_ENABLED = True
+METRICS_SNAPSHOT_PATH = os.path.join(LOG_DIR, 'metrics.json')
+METRICS_DUMP_INTERVAL = 60.0
+
+# Optional Prometheus-style endpoint for the scanners (None = off), e.g. 9108
+# for http://127.0.0.1:9108/metrics; keep it on localhost
+METRICS_HTTP_PORT = None
+METRICS_HTTP_HOST = '127.0.0.1'
+
 # Create directories if they don't exist
 os.makedirs(DB_DIR, exist_ok=True)
 os.makedirs(FACE_ENCODINGS_DIR, exist_ok=True)
@@ -1,47 +1,289 @@
 import sqlite3
 import os
-from config import DB_PATH
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from config import DB_PATH, DB_BUSY_TIMEOUT, DB_STATEMENT_CACHE_SIZE
 import hashlib
+from migrations import migrate, rebuild_aggregates as _rebuild_aggregates
+
+Student = namedtuple('Student', ['student_id', 'name', 'face_encoding_path'])
+AttendanceRecord = namedtuple('AttendanceRecord', ['student_id', 'name', 'timestamp'])
+LectureCount = namedtuple('LectureCount', ['date', 'lecture_number', 'count'])
+Attendee = namedtuple('Attendee', ['student_id', 'name', 'count'])
+HistoryEntry = namedtuple('HistoryEntry', ['date', 'lecture_number', 'timestamp'])
+LectureSession = namedtuple('LectureSession', ['id', 'date', 'lecture_number', 'room', 'started_at', 'ended_at'])
+Statistics = namedtuple('Statistics', ['total_students', 'today_attendance', 'recent_lectures', 'top_attendees'])
+
+# Statement strings are module constants so sqlite3's per-connection
+# statement cache finds the compiled statement on every call
+SQL_VERIFY_ADMIN = "SELECT 1 FROM admins WHERE username=? AND password=?"
+SQL_STUDENT_ENCODINGS = "SELECT student_id, face_encoding_path FROM students"
+SQL_STUDENT_METADATA = "SELECT student_id, name FROM students"
+SQL_STUDENT_NAME = "SELECT name FROM students WHERE student_id=?"
+SQL_STUDENT_EXISTS = "SELECT 1 FROM students WHERE student_id=?"
+SQL_STUDENT_ENCODING_PATH = "SELECT face_encoding_path FROM students WHERE student_id=?"
+SQL_LIST_STUDENTS = "SELECT student_id, name FROM students ORDER BY student_id"
+SQL_INSERT_STUDENT = "INSERT INTO students (name, student_id, face_encoding_path) VALUES (?, ?, ?)"
+SQL_INSERT_STUDENT_IF_NEW = "INSERT OR IGNORE INTO students (student_id, name, face_encoding_path) VALUES (?, ?, ?)"
+SQL_DELETE_STUDENT = "DELETE FROM students WHERE student_id=?"
+SQL_DELETE_STUDENT_ATTENDANCE = "DELETE FROM attendance WHERE student_id=?"
+SQL_INSERT_ATTENDANCE = '''INSERT OR IGNORE INTO attendance
+                           (student_id, date, lecture_number, timestamp, session_id)
+                           VALUES (?, ?, ?, ?, ?)'''
+# Next lecture number of the day, allocated and inserted in one statement
+SQL_ALLOCATE_SESSION = '''INSERT INTO lecture_sessions (date, lecture_number, room, started_at)
+                          SELECT ?, COALESCE(MAX(lecture_number), 0) + 1, ?, ?
+                          FROM lecture_sessions WHERE date=?'''
+SQL_OPEN_SESSION = '''INSERT INTO lecture_sessions (date, lecture_number, room, started_at)
+                      VALUES (?, ?, ?, ?)
+                      ON CONFLICT (date, lecture_number) DO UPDATE SET ended_at = NULL'''
+SQL_SESSION_BY_ID = "SELECT id, date, lecture_number, room, started_at, ended_at FROM lecture_sessions WHERE id=?"
+SQL_SESSION_BY_LECTURE = '''SELECT id, date, lecture_number, room, started_at, ended_at
+                            FROM lecture_sessions WHERE date=? AND lecture_number=?'''
+SQL_CLOSE_SESSION = "UPDATE lecture_sessions SET ended_at=? WHERE id=?"
+SQL_SESSION_ATTENDANCE = '''SELECT students.student_id, students.name, attendance.timestamp
+                            FROM attendance JOIN students
+                            ON attendance.student_id = students.student_id
+                            WHERE session_id=?
+                            ORDER BY timestamp'''
+SQL_LECTURE_ATTENDANCE = '''SELECT students.student_id, students.name, attendance.timestamp
+                            FROM attendance JOIN students
+                            ON attendance.student_id = students.student_id
+                            WHERE date=? AND lecture_number=?
+                            ORDER BY timestamp'''
+SQL_STUDENT_HISTORY = '''SELECT date, lecture_number, timestamp FROM attendance
+                         WHERE student_id=? ORDER BY date DESC, lecture_number DESC'''
+SQL_COUNT_STUDENTS = "SELECT COUNT(*) FROM students"
+SQL_COUNT_ATTENDANCE_ON = "SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date=?"
+# Statistics read the summary tables that triggers maintain (migration 3)
+SQL_RECENT_LECTURES = '''SELECT date, lecture_number, count FROM lecture_counts
+                         ORDER BY date DESC, lecture_number DESC LIMIT ?'''
+SQL_TOP_ATTENDEES = '''SELECT student_totals.student_id, students.name, student_totals.count
+                       FROM student_totals CROSS JOIN students
+                       ON students.student_id = student_totals.student_id
+                       ORDER BY student_totals.count DESC LIMIT ?'''
+
+_local = threading.local()
+
+
+def get_connection():
+    """Return this thread's connection, opening and configuring it on first use.
+
+    Connections are kept per thread (sqlite3 objects must not cross
+    threads) and reused for the thread's lifetime. WAL lets the kiosk read
+    while the attendance writer commits, and the busy timeout makes a
+    writer wait for a lock instead of failing.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)}")
+        _local.conn = conn
+    return conn
+
+
+def close_connection():
+    """Close the calling thread's connection, if it has one"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+
+def verify_admin(username, password):
+    hashed_password = hashlib.sha256(password.encode()).hexdigest()
+    return get_connection().execute(SQL_VERIFY_ADMIN, (username, hashed_password)).fetchone() is not None
+
+
+def get_student_encodings():
+    """(student_id, face_encoding_path) for every registered student"""
+    return get_connection().execute(SQL_STUDENT_ENCODINGS).fetchall()
+
+
+def get_student_metadata():
+    """(student_id, name) for every registered student, for the in-memory StudentDirectory"""
+    return get_connection().execute(SQL_STUDENT_METADATA).fetchall()
+
+
+def get_student_name(student_id):
+    row = get_connection().execute(SQL_STUDENT_NAME, (student_id,)).fetchone()
+    return row[0] if row else None
+
+
+def student_exists(student_id):
+    return get_connection().execute(SQL_STUDENT_EXISTS, (student_id,)).fetchone() is not None
+
+
+def list_students():
+    return get_connection().execute(SQL_LIST_STUDENTS).fetchall()
+
+
+def add_student(student_id, name, face_encoding_path):
+    """Insert a student; raises sqlite3.IntegrityError if the ID is taken"""
+    conn = get_connection()
+    with conn:
+        conn.execute(SQL_INSERT_STUDENT, (name, student_id, face_encoding_path))
+    return Student(student_id, name, face_encoding_path)
+
+
+def add_students(rows):
+    """Insert (student_id, name, face_encoding_path) rows in one transaction, skipping taken IDs.
+
+    Returns one bool per row: False when the student ID was already taken.
+    """
+    conn = get_connection()
+    inserted = []
+    with conn:
+        c = conn.cursor()
+        for row in rows:
+            c.execute(SQL_INSERT_STUDENT_IF_NEW, tuple(row))
+            inserted.append(c.rowcount == 1)
+    return inserted
+
+
+def delete_student(student_id):
+    """Delete a student and their attendance; returns their encoding path (or None)"""
+    conn = get_connection()
+    with conn:
+        row = conn.execute(SQL_STUDENT_ENCODING_PATH, (student_id,)).fetchone()
+        conn.execute(SQL_DELETE_STUDENT, (student_id,))
+        conn.execute(SQL_DELETE_STUDENT_ATTENDANCE, (student_id,))
+    return row[0] if row else None
+
+
+@contextmanager
+def _immediate(conn):
+    """Transaction that takes the write lock up front, so concurrent kiosks queue"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def open_lecture_session(date, room=None, lecture_number=None):
+    """Start (or rejoin) a lecture session and return it.
+
+    Without a lecture_number the next free number of the day is allocated;
+    the write lock makes that safe when several kiosks open lectures at
+    once. With one, every kiosk asking for the same lecture shares a
+    single session, which is reopened if it had been closed.
+    """
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with _immediate(get_connection()) as conn:
+        if lecture_number is None:
+            session_id = conn.execute(SQL_ALLOCATE_SESSION, (date, room, now, date)).lastrowid
+            row = conn.execute(SQL_SESSION_BY_ID, (session_id,)).fetchone()
+        else:
+            conn.execute(SQL_OPEN_SESSION, (date, lecture_number, room, now))
+            row = conn.execute(SQL_SESSION_BY_LECTURE, (date, lecture_number)).fetchone()
+    return LectureSession(*row)
+
+
+def close_lecture_session(session_id):
+    conn = get_connection()
+    with conn:
+        conn.execute(SQL_CLOSE_SESSION, (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), session_id))
+
+
+def get_session_attendance(session_id):
+    rows = get_connection().execute(SQL_SESSION_ATTENDANCE, (session_id,)).fetchall()
+    return [AttendanceRecord(*row) for row in rows]
+
+
+def insert_attendance(marks):
+    """Insert (student_id, date, lecture_number, timestamp, session_id) rows in one transaction.
+
+    Returns one bool per mark: False when the UNIQUE constraint made the
+    insert a no-op because the student was already marked.
+    """
+    conn = get_connection()
+    inserted = []
+    with conn:
+        c = conn.cursor()
+        for mark in marks:
+            c.execute(SQL_INSERT_ATTENDANCE, tuple(mark))
+            inserted.append(c.rowcount == 1)
+    return inserted
+
+
+def get_lecture_attendance(date, lecture_num):
+    rows = get_connection().execute(SQL_LECTURE_ATTENDANCE, (date, lecture_num)).fetchall()
+    return [AttendanceRecord(*row) for row in rows]
+
+
+def get_statistics(today, limit=5):
+    conn = get_connection()
+    return Statistics(
+        total_students=conn.execute(SQL_COUNT_STUDENTS).fetchone()[0],
+        today_attendance=conn.execute(SQL_COUNT_ATTENDANCE_ON, (str(today),)).fetchone()[0],
+        recent_lectures=[LectureCount(*row) for row in conn.execute(SQL_RECENT_LECTURES, (limit,))],
+        top_attendees=[Attendee(*row) for row in conn.execute(SQL_TOP_ATTENDEES, (limit,))],
+    )
+
+
+def get_student_history(student_id):
+    return [HistoryEntry(*row) for row in get_connection().execute(SQL_STUDENT_HISTORY, (student_id,))]
+
+
+def rebuild_aggregates():
+    """Recompute lecture_counts and student_totals from scratch (repair)"""
+    conn = get_connection()
+    with conn:
+        _rebuild_aggregates(conn)
+
+
+# Queries on the kiosk and admin hot paths, with sample parameters, that
+# must be answered from an index
+HOT_QUERIES = {
+    'verify_admin': (SQL_VERIFY_ADMIN, ('admin', '')),
+    'student_name': (SQL_STUDENT_NAME, ('',)),
+    'student_exists': (SQL_STUDENT_EXISTS, ('',)),
+    'lecture_report': (SQL_LECTURE_ATTENDANCE, ('', 1)),
+    'attendance_on_date': (SQL_COUNT_ATTENDANCE_ON, ('',)),
+    'student_history': (SQL_STUDENT_HISTORY, ('',)),
+    'session_attendance': (SQL_SESSION_ATTENDANCE, (1,)),
+    'session_by_lecture': (SQL_SESSION_BY_LECTURE, ('', 1)),
+    'allocate_session': (SQL_ALLOCATE_SESSION, ('', None, '', '')),
+    'recent_lectures': (SQL_RECENT_LECTURES, (5,)),
+    'top_attendees': (SQL_TOP_ATTENDEES, (5,)),
+}
+
+# Top-N queries that may walk an index (or a WITHOUT ROWID table, which is
+# stored in primary-key order) because they stop after LIMIT rows; they
+# must not sort, which would mean reading every row first
+INDEX_ORDERED_QUERIES = {'recent_lectures', 'top_attendees'}
+
+
+def check_query_plans(conn=None):
+    """EXPLAIN QUERY PLAN every hot query; returns {name: steps} for those that scan or sort a table"""
+    conn = conn or get_connection()
+    problems = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        steps = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        if name in INDEX_ORDERED_QUERIES:
+            scans = [step for step in steps if 'TEMP B-TREE' in step]
+        else:
+            scans = [step for step in steps if step.startswith('SCAN')]
+        if scans:
+            problems[name] = scans
+    return problems
+
 
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Students table
-    c.execute('''CREATE TABLE IF NOT EXISTS students
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  name TEXT NOT NULL,
-                  student_id TEXT UNIQUE,
-                  face_encoding_path TEXT)''')
-                 
-    # Attendance table
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  student_id TEXT,
-                  date DATE,
-                  lecture_number INTEGER,
-                  timestamp DATETIME,
-                  UNIQUE(student_id, date, lecture_number))''')  # Added unique constraint
-                  
-    # Admin credentials
-    c.execute('''CREATE TABLE IF NOT EXISTS admins
-                 (username TEXT PRIMARY KEY,
-                  password TEXT)''')
-    
-    # Insert default admin with hashed password
-    default_password = hashlib.sha256("admin123".encode()).hexdigest()
-    c.execute("INSERT OR IGNORE INTO admins VALUES (?, ?)", ('admin', default_password))
-    
-    # Create indexes for better performance
-    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_id ON attendance(student_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance(date)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_lecture ON attendance(lecture_number)")
-    
-    conn.commit()
-    conn.close()
+    """Create the database or upgrade it to the current schema"""
+    migrate(get_connection())
 
 if __name__ == '__main__':
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
+    # A stale WAL must not be replayed into the fresh database
+    for path in (DB_PATH, DB_PATH + '-wal', DB_PATH + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
     init_db()
-    print("Database initialized successfully!")
\ No newline at end of file
+    print("Database initialized successfully!")
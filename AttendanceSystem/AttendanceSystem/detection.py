@@ -0,0 +1,357 @@
+import os
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+import face_recognition
+import face_recognition.api
+from collections import namedtuple
+import metrics
+from pipeline import LatestQueue
+from motion import MotionGate
+
+# Cascades bundled with opencv-python, by backend name. The wheels only ship
+# the Haar files; LBP cascades come from the OpenCV sources (cascade_path).
+BUNDLED_CASCADES = {
+    'haar': 'haarcascade_frontalface_default.xml',
+    'lbp': 'lbpcascade_frontalface_improved.xml',
+}
+BACKENDS = ('hog', 'haar', 'lbp', 'haar+hog', 'lbp+hog')
+
+# What detection actually looks at: the ROI's bounding box cut out of the
+# camera frame, masked outside the ROI polygon, resized by `scale` and
+# converted to RGB. origin is the (x, y) of the cut-out in the frame.
+# changed lists the (top, right, bottom, left) areas of rgb that differ
+# from the motion background, or is None when that is unknown.
+DetectionFrame = namedtuple('DetectionFrame', ['rgb', 'origin', 'scale', 'changed'], defaults=(None,))
+# Latest result of a PreviewDetector: the BGR frame it ran on, the face
+# boxes in that frame and when it finished
+PreviewDetection = namedtuple('PreviewDetection', ['frame', 'boxes', 'timestamp'])
+
+
+def frame_boxes(prepared, locations):
+    """Map (top, right, bottom, left) locations in prepared.rgb back to camera-frame boxes."""
+    x0, y0 = prepared.origin
+    scale = prepared.scale
+    return [(int(top / scale) + y0, int(right / scale) + x0, int(bottom / scale) + y0, int(left / scale) + x0)
+            for top, right, bottom, left in locations]
+
+
+def _merge_regions(regions):
+    """Union overlapping (top, right, bottom, left) windows so no pixel is refined twice."""
+    merged = []
+    for region in sorted(regions, key=lambda r: r[3]):
+        top, right, bottom, left = region
+        for i, (m_top, m_right, m_bottom, m_left) in enumerate(merged):
+            if left < m_right and m_left < right and top < m_bottom and m_top < bottom:
+                merged[i] = (min(top, m_top), max(right, m_right), max(bottom, m_bottom), min(left, m_left))
+                break
+        else:
+            merged.append(region)
+    return merged if len(merged) == len(regions) else _merge_regions(merged)
+
+
+def _grow(boxes, margin, width, height):
+    """Grow (top, right, bottom, left) boxes by margin of their size, clipped to the image"""
+    grown = []
+    for top, right, bottom, left in boxes:
+        grow_y, grow_x = (bottom - top) * margin, (right - left) * margin
+        grown.append((max(0, int(top - grow_y)), min(width, int(right + grow_x)),
+                      min(height, int(bottom + grow_y)), max(0, int(left - grow_x))))
+    return [box for box in grown if box[1] > box[3] and box[2] > box[0]]
+
+
+def _detect_in(backend, image, regions, upsample):
+    """Run backend inside each (top, right, bottom, left) region; locations are in image coordinates"""
+    locations = []
+    for top, right, bottom, left in regions:
+        for f_top, f_right, f_bottom, f_left in backend.detect(image[top:bottom, left:right], upsample):
+            locations.append((f_top + top, f_right + left, f_bottom + top, f_left + left))
+    return locations
+
+
+class HogBackend:
+    """dlib's HOG detector, as used by face_recognition.face_locations.
+
+    A ``threshold`` below 0 also returns weaker detections, for use as a
+    proposal stage.
+    """
+
+    name = 'hog'
+
+    def __init__(self, threshold=0.0):
+        self.threshold = threshold
+
+    def detect(self, image, upsample=1):
+        """(top, right, bottom, left) face locations in an RGB image"""
+        if self.threshold:
+            # face_locations has no threshold argument; ask dlib directly
+            rects, _, _ = face_recognition.api.face_detector.run(image, upsample, self.threshold)
+            height, width = image.shape[:2]
+            return [(max(0, rect.top()), min(width, rect.right()), min(height, rect.bottom()), max(0, rect.left()))
+                    for rect in rects]
+        return face_recognition.face_locations(image, number_of_times_to_upsample=upsample)
+
+
+# Loaded cascades by path; cv2.CascadeClassifier cannot be pickled, so each
+# process (and each pool worker) loads a file once on first use
+_classifiers = {}
+
+
+class CascadeBackend:
+    """OpenCV Haar or LBP cascade: several times faster than HOG, with more
+    false positives and a weaker grip on turned faces.
+    """
+
+    def __init__(self, path, name=None, scale_factor=1.1, min_neighbors=4):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Cascade file not found: {path}")
+        self.name = name or os.path.basename(path)
+        self.path = path
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        # Fail here, not on the first frame, if the file is not a cascade
+        self.classifier
+
+    @property
+    def classifier(self):
+        classifier = _classifiers.get(self.path)
+        if classifier is None:
+            classifier = _classifiers[self.path] = cv2.CascadeClassifier(self.path)
+            if classifier.empty():
+                raise ValueError(f"Could not load cascade {self.path}")
+        return classifier
+
+    def detect(self, image, upsample=1):
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+        factor = 2 ** upsample
+        if factor > 1:
+            # Same meaning as for HOG: find faces down to half the size per step
+            gray = cv2.resize(gray, (0, 0), fx=factor, fy=factor)
+        gray = cv2.equalizeHist(gray)
+        rects = self.classifier.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                                 minNeighbors=self.min_neighbors)
+        return [(int(y / factor), int((x + w) / factor), int((y + h) / factor), int(x / factor))
+                for x, y, w, h in rects]
+
+
+class ConfirmedBackend:
+    """A fast backend proposes faces and a slower, stricter one confirms them.
+
+    The confirming backend only runs inside each proposal grown by
+    ``margin`` of its size, so HOG's precision costs a fraction of a
+    full-frame HOG pass.
+    """
+
+    def __init__(self, propose, confirm, margin=0.25):
+        self.name = f"{propose.name}+{confirm.name}"
+        self.propose = propose
+        self.confirm = confirm
+        self.margin = margin
+
+    def detect(self, image, upsample=1):
+        height, width = image.shape[:2]
+        proposals = self.propose.detect(image, upsample)
+        metrics.count('detection_proposals', len(proposals))
+        regions = _merge_regions(_grow(proposals, self.margin, width, height))
+        return _detect_in(self.confirm, image, regions, upsample)
+
+
+def bundled_cascade(kind):
+    """Path of the frontal-face cascade for 'haar' or 'lbp' shipped with OpenCV, if present"""
+    filename = BUNDLED_CASCADES[kind]
+    root = os.path.dirname(os.path.normpath(cv2.data.haarcascades))
+    for folder in (cv2.data.haarcascades, os.path.join(root, 'lbpcascades'), root):
+        path = os.path.join(folder, filename)
+        if os.path.isfile(path):
+            return path
+    return os.path.join(cv2.data.haarcascades, filename)
+
+
+def create_backend(name='hog', cascade_path=None, hog_threshold=0.0):
+    """Backend for one of BACKENDS; falls back to HOG (and logs why) if a cascade cannot be found"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown detector backend {name!r}; expected one of {', '.join(BACKENDS)}")
+    if name == 'hog':
+        return HogBackend(hog_threshold)
+    kind = name.split('+')[0]
+    try:
+        cascade = CascadeBackend(cascade_path or bundled_cascade(kind), kind)
+    except (OSError, ValueError, AttributeError) as e:
+        # AttributeError: OpenCV builds without the objdetect cascades
+        logging.error(f"Detector backend {name} unavailable, using HOG: {str(e)}")
+        return HogBackend(hog_threshold)
+    if name.endswith('+hog'):
+        return ConfirmedBackend(cascade, HogBackend(hog_threshold))
+    return cascade
+
+
+class FaceDetector:
+    """Face detection restricted to a door ROI, optionally coarse-to-fine.
+
+    ``backend`` does the detecting (HogBackend by default) and
+    ``coarse_backend``, if given, replaces it for the coarse pass.
+
+    ``roi`` is either a rectangle ``(x0, y0, x1, y1)`` or a polygon
+    ``[(x, y), ...]``, in fractions of the frame size. Pixels outside its
+    bounding box are never resized or scanned, and pixels inside the box but
+    outside a polygon are blacked out.
+
+    Without ``coarse_scale`` every frame is scanned once at ``scale`` with
+    ``upsample``. With it, the frame is first scanned at ``coarse_scale``
+    (with ``coarse_upsample``). The ``scale`` pass then only runs inside those
+    candidates, each grown by ``refine_margin`` of its size on every side,
+    and inside the areas where the motion gate sees movement, where a
+    face too small for the coarse pass may be walking in. Boxes and
+    encodings come from the higher resolution while static background is
+    only ever looked at coarsely.
+
+    prepare() keeps a MotionGate background for the change check, so use
+    one detector per camera.
+    """
+
+    def __init__(self, backend=None, scale=0.5, upsample=1, roi=None, coarse_scale=None, coarse_upsample=1,
+                 coarse_backend=None, refine_margin=0.5, motion_threshold=25):
+        self.backend = backend or HogBackend()
+        self.coarse_backend = coarse_backend or self.backend
+        self.scale = scale
+        self.upsample = upsample
+        self.roi = roi
+        self.coarse_scale = coarse_scale if coarse_scale and coarse_scale < scale else None
+        self.coarse_upsample = coarse_upsample
+        self.refine_margin = refine_margin
+        # Same background model and threshold as the pipeline's motion gate,
+        # run on the ROI to find where a face may be walking in
+        self.motion = MotionGate(threshold=motion_threshold)
+        # Pixels (after upsampling) scanned for the last frame
+        self.last_pixels = 0
+        self._windows = {}
+
+    def _window(self, frame_shape, small_shape):
+        """ROI bounding box in the frame and the polygon mask at detection size, cached per frame size"""
+        key = (frame_shape[:2], small_shape)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = self._build_window(frame_shape, small_shape)
+        return window
+
+    def _build_window(self, frame_shape, small_shape):
+        height, width = frame_shape[:2]
+        if self.roi is None:
+            return 0, 0, width, height, None
+        if len(self.roi) == 4 and all(np.isscalar(v) for v in self.roi):
+            x0, y0, x1, y1 = self.roi
+            points = None
+        else:
+            points = np.asarray(self.roi, dtype=np.float64) * (width, height)
+            (x0, y0), (x1, y1) = points.min(axis=0) / (width, height), points.max(axis=0) / (width, height)
+        left, top = max(0, int(x0 * width)), max(0, int(y0 * height))
+        right, bottom = min(width, int(np.ceil(x1 * width))), min(height, int(np.ceil(y1 * height)))
+        if right <= left or bottom <= top:
+            raise ValueError(f"Detection ROI {self.roi} is empty")
+
+        mask = None
+        if points is not None and small_shape is not None:
+            mask = np.zeros(small_shape, dtype=np.uint8)
+            polygon = ((points - (left, top)) * self.scale).round().astype(np.int32)
+            cv2.fillPoly(mask, [polygon], 255)
+        return left, top, right, bottom, mask
+
+    def prepare(self, frame):
+        """Cut, mask, resize and convert a BGR camera frame; cheap enough for the capture side."""
+        with metrics.timer('resize'):
+            left, top, right, bottom, _ = self._window(frame.shape, None)
+            crop = frame[top:bottom, left:right]
+            small = cv2.resize(crop, (0, 0), fx=self.scale, fy=self.scale) if self.scale != 1 else crop
+            mask = self._window(frame.shape, small.shape[:2])[4]
+            if mask is not None:
+                small = cv2.bitwise_and(small, small, mask=mask)
+            changed = self.motion.changed_regions(small) if self.coarse_scale is not None else None
+            return DetectionFrame(cv2.cvtColor(small, cv2.COLOR_BGR2RGB), (left, top), self.scale, changed)
+
+    def locate(self, prepared):
+        """(top, right, bottom, left) face locations in prepared.rgb"""
+        rgb = prepared.rgb
+        height, width = rgb.shape[:2]
+        with metrics.timer('detection'):
+            if self.coarse_scale is None:
+                self.last_pixels = height * width * 4 ** self.upsample
+                locations = self.backend.detect(rgb, self.upsample)
+            else:
+                ratio = self.coarse_scale / prepared.scale
+                coarse = cv2.resize(rgb, (0, 0), fx=ratio, fy=ratio, interpolation=cv2.INTER_AREA)
+                candidates = self.coarse_backend.detect(coarse, self.coarse_upsample)
+                metrics.count('detection_candidates', len(candidates))
+                self.last_pixels = coarse.shape[0] * coarse.shape[1] * 4 ** self.coarse_upsample
+
+                if prepared.changed is None:
+                    # No motion background yet: refine everywhere
+                    regions = [(0, width, height, 0)]
+                else:
+                    pad = int(8 / ratio)
+                    regions = _grow([(top - pad, right + pad, bottom + pad, left - pad)
+                                     for top, right, bottom, left in prepared.changed], 0, width, height)
+                scaled = [tuple(v / ratio for v in box) for box in candidates]
+                regions = _merge_regions(regions + _grow(scaled, self.refine_margin, width, height))
+
+                for top, right, bottom, left in regions:
+                    self.last_pixels += (bottom - top) * (right - left) * 4 ** self.upsample
+                locations = _detect_in(self.backend, rgb, regions, self.upsample)
+        metrics.count('detection_pixels', self.last_pixels)
+        return locations
+
+
+class PreviewDetector:
+    """Detects faces in a live preview on a background thread.
+
+    The preview hands over every frame it shows with submit(), which never
+    blocks; the thread only looks at the newest one, at most ``max_fps``
+    times a second, shrunk by ``scale``. latest() returns the last
+    detection together with the frame it ran on, so boxes can be drawn on
+    newer frames and a capture can reuse exactly what was detected.
+    """
+
+    def __init__(self, backend=None, max_fps=4, scale=0.5, upsample=1):
+        self.backend = backend or HogBackend()
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.scale = scale
+        self.upsample = upsample
+        self.pending = LatestQueue(1)
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='preview-detection', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame):
+        self.pending.put(frame)
+
+    def latest(self):
+        with self._lock:
+            return self._latest
+
+    def _run(self):
+        while True:
+            started = time.time()
+            frame = self.pending.get()
+            if frame is None:
+                break
+            try:
+                small = cv2.resize(frame, (0, 0), fx=self.scale, fy=self.scale) if self.scale != 1 else frame
+                locations = self.backend.detect(cv2.cvtColor(small, cv2.COLOR_BGR2RGB), self.upsample)
+            except Exception as e:
+                # Fall through to the wait below, so a failing backend cannot spin
+                logging.error(f"Preview detection error: {str(e)}")
+                locations = []
+            boxes = [tuple(int(v / self.scale) for v in location) for location in locations]
+            with self._lock:
+                self._latest = PreviewDetection(frame, boxes, time.time())
+            # Leave the CPU to the Tk thread between detections
+            if self._stopped.wait(max(0.0, self.min_interval - (time.time() - started))):
+                break
+
+    def stop(self):
+        self._stopped.set()
+        self.pending.close()
+        self._thread.join(timeout=2)
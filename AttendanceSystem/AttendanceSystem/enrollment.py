@@ -0,0 +1,197 @@
+import os
+import re
+import csv
+import logging
+import multiprocessing
+from functools import partial
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+import face_recognition
+from config import FACE_ENCODINGS_DIR
+from detection import HogBackend
+import database
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+# Student IDs name the encoding file, so they must be plain file names
+STUDENT_ID_PATTERN = re.compile(r'[A-Za-z0-9][A-Za-z0-9._-]*')
+
+# One student to enroll from a photo
+EnrollmentItem = namedtuple('EnrollmentItem', ['student_id', 'name', 'image_path'])
+# Outcome of encoding one photo; error is set (and encoding None) on rejection
+EnrollmentResult = namedtuple('EnrollmentResult', ['item', 'encoding', 'error'])
+
+
+def read_directory(path):
+    """One student per image, named after the file: known_faces/jeet.jpg -> ID 'jeet'"""
+    items = []
+    for filename in sorted(os.listdir(path)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() in IMAGE_EXTENSIONS:
+            items.append(EnrollmentItem(stem, stem.replace('_', ' '), os.path.join(path, filename)))
+    return items
+
+
+def read_manifest(path):
+    """CSV with student_id, name and image_path columns; relative paths are taken from the CSV's folder"""
+    base = os.path.dirname(os.path.abspath(path))
+    items = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'student_id', 'name', 'image_path'} - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Manifest is missing columns: {', '.join(sorted(missing))}")
+        for row in reader:
+            image_path = row['image_path'].strip()
+            items.append(EnrollmentItem(row['student_id'].strip(), row['name'].strip(),
+                                        os.path.join(base, image_path)))
+    return items
+
+
+def read_source(path):
+    return read_directory(path) if os.path.isdir(path) else read_manifest(path)
+
+
+def encoding_path(student_id):
+    return os.path.join(FACE_ENCODINGS_DIR, f"{student_id}.npy")
+
+
+def encode_image(item, max_side=1024, upsample=1, num_jitters=1, backend=None):
+    """Decode one photo and encode its face; rejects photos without exactly one face.
+
+    Runs in the pool workers, which load the dlib models once when they
+    import this module. backend is the face detector (HOG by default).
+    """
+    try:
+        image = face_recognition.load_image_file(item.image_path)
+    except Exception as e:
+        return EnrollmentResult(item, None, f"Unreadable image: {str(e)}")
+
+    # Phone photos are far larger than HOG needs to find a portrait face
+    height, width = image.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    face_locations = (backend or HogBackend()).detect(image, upsample)
+    if len(face_locations) != 1:
+        error = "No face detected" if not face_locations else "Multiple faces detected"
+        return EnrollmentResult(item, None, error)
+
+    face_encodings = face_recognition.face_encodings(image, face_locations, num_jitters=num_jitters)
+    if not face_encodings:
+        return EnrollmentResult(item, None, "Failed to generate face encoding")
+    return EnrollmentResult(item, face_encodings[0], None)
+
+
+class BulkEnroller:
+    """Enrolls many students from photos using a pool of encoding processes.
+
+    Students already in the database are skipped, so an interrupted import
+    is resumed by simply running it again. Encodings are saved as they
+    arrive and the students rows are inserted ``batch_size`` at a time, one
+    transaction per batch; the batch in hand is committed on interruption.
+    """
+
+    def __init__(self, workers=None, batch_size=200, max_side=1024, upsample=1, num_jitters=1, backend=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.encode = partial(encode_image, max_side=max_side, upsample=upsample, num_jitters=num_jitters,
+                              backend=backend)
+        self.enrolled = 0
+        self.skipped = 0
+        self.rejected = []
+
+    def pending_items(self, items):
+        """Drop students that are already enrolled or listed twice, and reject unusable IDs"""
+        students = database.get_student_encodings()
+        existing = {str(student_id) for student_id, _ in students}
+        # Files of enrolled students are never overwritten, even when the IDs
+        # differ only in case on a case-insensitive file system
+        taken_paths = {os.path.normcase(os.path.abspath(path)) for _, path in students}
+        pending = []
+        for item in items:
+            if item.student_id in existing:
+                self.skipped += 1
+            elif not item.student_id or not item.name:
+                self.rejected.append(EnrollmentResult(item, None, "Missing student ID or name"))
+            elif not STUDENT_ID_PATTERN.fullmatch(item.student_id):
+                self.rejected.append(EnrollmentResult(
+                    item, None, "Student ID may only contain letters, digits, '.', '_' and '-'"))
+            elif os.path.normcase(os.path.abspath(encoding_path(item.student_id))) in taken_paths:
+                self.rejected.append(EnrollmentResult(item, None, "Encoding file belongs to another student"))
+            else:
+                existing.add(item.student_id)
+                taken_paths.add(os.path.normcase(os.path.abspath(encoding_path(item.student_id))))
+                pending.append(item)
+        return pending
+
+    def _results(self, items):
+        if self.workers <= 1:
+            yield from map(self.encode, items)
+            return
+        # spawn keeps workers free of the parent's Tk and camera handles
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            # A few photos per worker are queued ahead; on Ctrl-C the rest are
+            # cancelled, so only the photos already being encoded are waited for
+            in_flight = deque()
+            try:
+                for item in items:
+                    if len(in_flight) >= 4 * self.workers:
+                        yield in_flight.popleft().result()
+                    in_flight.append(executor.submit(self.encode, item))
+                while in_flight:
+                    yield in_flight.popleft().result()
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def _commit(self, batch, on_result=None):
+        """Insert a batch of (item, temporary encoding file) and move each file into place.
+
+        A file only replaces the student's .npy once its row is committed;
+        if another enrollment took the ID since pending_items ran, the
+        encoding is discarded and the photo reported as rejected.
+        """
+        inserted = database.add_students(
+            [(item.student_id, item.name, encoding_path(item.student_id)) for item, _ in batch])
+        for (item, tmp_path), was_inserted in zip(batch, inserted):
+            if was_inserted:
+                os.replace(tmp_path, encoding_path(item.student_id))
+                self.enrolled += 1
+                continue
+            os.remove(tmp_path)
+            result = EnrollmentResult(item, None, "Student ID was taken by another enrollment")
+            self.rejected.append(result)
+            if on_result:
+                on_result(result)
+        logging.info(f"Bulk enrollment: committed {sum(inserted)} students ({self.enrolled} total)")
+
+    def run(self, items, on_result=None):
+        """Enroll every item; on_result(result) is called as each photo is processed"""
+        os.makedirs(FACE_ENCODINGS_DIR, exist_ok=True)
+        pending = self.pending_items(items)
+        if on_result:
+            for result in self.rejected:
+                on_result(result)
+        batch = []
+        try:
+            for result in self._results(pending):
+                if result.error:
+                    self.rejected.append(result)
+                else:
+                    # Kept under a temporary name until the student's row is committed
+                    tmp_path = f"{encoding_path(result.item.student_id)[:-4]}.{os.getpid()}.tmp.npy"
+                    np.save(tmp_path, result.encoding)
+                    batch.append((result.item, tmp_path))
+                if on_result:
+                    on_result(result)
+                if len(batch) >= self.batch_size:
+                    self._commit(batch, on_result)
+                    batch = []
+        finally:
+            if batch:
+                self._commit(batch, on_result)
+        return self.enrolled
@@ -0,0 +1,354 @@
+import os
+import struct
+import zlib
+import hashlib
+import logging
+import threading
+import numpy as np
+from collections import namedtuple
+
+EMBEDDING_DIM = 128
+
+# Packed snapshot layout: header, (T, 128) float32 template embeddings, (T,)
+# float32 squared norms, (N + 1,) int64 per-student template offsets, then
+# the NUL-separated UTF-8 student ID table.
+SNAPSHOT_MAGIC = b'FGALLERY'
+SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<8sIIIII32sQQQQQ')
+SNAPSHOT_ALIGN = 64
+
+# Result of matching one probe face against the gallery.
+# index is the student's position in gallery.ids(), or -1 when the gallery
+# is empty; margin is the gap between the best and the runner-up student's
+# distance (inf when there is no runner-up).
+Match = namedtuple('Match', ['index', 'student_id', 'distance', 'margin'])
+
+
+class FaceGallery:
+    """Known face templates packed into one contiguous (T, 128) float32 matrix.
+
+    A student may hold several templates (e.g. samples taken under different
+    lighting and pose). They are stored back to back, so the templates of
+    student i are rows ``offsets[i]:offsets[i + 1]``, and matching takes the
+    per-student minimum with one segmented reduction over those ranges.
+
+    A gallery is an immutable snapshot: it is never modified after it has
+    been built, so the scanner can keep matching against it while a
+    GalleryStore publishes newer ones.
+    """
+
+    def __init__(self, student_ids=None, encodings=None, sq_norms=None, offsets=None):
+        # student_ids may be a list shared with newer snapshots (see
+        # GalleryStore); only the first len(self) entries belong to this one
+        if isinstance(student_ids, list):
+            self.student_ids = student_ids
+        else:
+            self.student_ids = list(student_ids or [])
+        if encodings is None or len(self.student_ids) == 0:
+            encodings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        elif offsets is None and not isinstance(encodings, np.ndarray):
+            # A list with one (128,) encoding or (K, 128) stack per student
+            templates = [np.asarray(e, dtype=np.float32).reshape(-1, EMBEDDING_DIM) for e in encodings]
+            offsets = np.cumsum([0] + [len(t) for t in templates])
+            encodings = np.concatenate(templates) if templates else np.empty((0, EMBEDDING_DIM))
+        self.encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if offsets is None:
+            offsets = np.arange(len(self.encodings) + 1)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        if len(self.student_ids) < len(self) or self.offsets[-1] != len(self.encodings):
+            raise ValueError("Number of encodings does not match number of student IDs")
+        # reduceat needs every segment to be non-empty
+        if len(self) and np.any(self.offsets[1:] <= self.offsets[:-1]):
+            raise ValueError("Every student needs at least one template")
+        # Squared norms are precomputed once so matching is a single GEMM
+        if sq_norms is None or len(sq_norms) != len(self.encodings):
+            sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+        self.sq_norms = sq_norms
+        self._owners = None
+        # Snapshots of one store with the same epoch share their leading rows
+        self.epoch = 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def n_templates(self):
+        return len(self.encodings)
+
+    def ids(self):
+        return self.student_ids[:len(self)]
+
+    def template_owners(self):
+        """Student index of every template row"""
+        if self._owners is None:
+            self._owners = np.repeat(np.arange(len(self)), np.diff(self.offsets))
+        return self._owners
+
+    def distances(self, face_encodings):
+        """Euclidean distances of shape (faces, T) between probes and every template."""
+        probes = np.asarray(face_encodings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        probe_sq = np.einsum('ij,ij->i', probes, probes)
+        sq = probe_sq[:, None] + self.sq_norms[None, :] - 2.0 * (probes @ self.encodings.T)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def student_distances(self, face_encodings):
+        """Distance of shape (faces, N) from each probe to each student's closest template."""
+        dist = self.distances(face_encodings)
+        if self.n_templates == len(self):
+            return dist
+        return np.minimum.reduceat(dist, self.offsets[:-1], axis=1)
+
+    def match(self, face_encodings):
+        """Match every face of a frame against every student in one pass."""
+        n_faces = len(face_encodings)
+        if n_faces == 0:
+            return []
+        if len(self) == 0:
+            return [Match(-1, None, float('inf'), float('inf')) for _ in range(n_faces)]
+
+        dist = self.student_distances(face_encodings)
+        rows = np.arange(n_faces)
+        if len(self) == 1:
+            best = np.zeros(n_faces, dtype=np.intp)
+            best_dist = dist[:, 0]
+            second_dist = np.full(n_faces, np.inf, dtype=np.float32)
+        else:
+            # argpartition finds best and runner-up without a full sort
+            top2 = np.argpartition(dist, 1, axis=1)[:, :2]
+            top2_dist = dist[rows[:, None], top2]
+            order = np.argsort(top2_dist, axis=1)
+            best = top2[rows, order[:, 0]]
+            best_dist = top2_dist[rows, order[:, 0]]
+            second_dist = top2_dist[rows, order[:, 1]]
+
+        return [
+            Match(int(i), self.student_ids[i], float(d), float(s - d))
+            for i, d, s in zip(best, best_dist, second_dist)
+        ]
+
+
+class GalleryStore:
+    """Mutable owner of the gallery that publishes immutable FaceGallery snapshots.
+
+    Readers take ``store.snapshot`` once and keep using it; add() and
+    remove() build a new snapshot and swap it in with a single attribute
+    assignment, so in-flight matching never sees a half-updated gallery.
+    add() only appends, so every snapshot with the same ``epoch`` agrees on
+    its leading rows.
+    """
+
+    def __init__(self, gallery=None):
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._load(gallery or FaceGallery())
+
+    def _load(self, gallery):
+        # Rows are appended into spare capacity past the end of the current
+        # snapshot, which older snapshots never read, so add() copies nothing
+        # until the buffer has to grow
+        self._encodings = gallery.encodings
+        self._sq_norms = gallery.sq_norms
+        self._offsets = gallery.offsets
+        self._ids = gallery.ids()
+        self._index = {sid: i for i, sid in enumerate(self._ids)}
+        self._count = len(gallery)
+        self._rows = gallery.n_templates
+        self._owned = False
+        self._epoch += 1
+        gallery.epoch = self._epoch
+        self.snapshot = gallery
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def __contains__(self, student_id):
+        return student_id in self._index
+
+    def _publish(self):
+        encodings = self._encodings[:self._rows]
+        sq_norms = self._sq_norms[:self._rows]
+        offsets = self._offsets[:self._count + 1]
+        encodings.flags.writeable = False
+        sq_norms.flags.writeable = False
+        offsets.flags.writeable = False
+        gallery = FaceGallery(self._ids, encodings, sq_norms, offsets)
+        gallery.epoch = self._epoch
+        self.snapshot = gallery
+
+    def _grow(self, n_new):
+        capacity = max(16, 2 * (self._rows + n_new))
+        encodings = np.empty((capacity, EMBEDDING_DIM), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        # Every student has a template, so there are never more students than rows
+        offsets = np.empty(capacity + 1, dtype=np.int64)
+        encodings[:self._rows] = self._encodings[:self._rows]
+        sq_norms[:self._rows] = self._sq_norms[:self._rows]
+        offsets[:self._count + 1] = self._offsets[:self._count + 1]
+        self._encodings = encodings
+        self._sq_norms = sq_norms
+        self._offsets = offsets
+        self._owned = True
+
+    def replace(self, gallery):
+        """Publish a fully rebuilt gallery, e.g. after a reload from disk."""
+        with self._lock:
+            self._load(gallery)
+
+    def add(self, student_id, templates):
+        """Add or re-enroll one student with a (128,) encoding or (K, 128) templates.
+
+        Amortized O(K) for new students.
+        """
+        templates = np.asarray(templates, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if len(templates) == 0:
+            raise ValueError("A student needs at least one template")
+        with self._lock:
+            if student_id in self._index:
+                self._remove_locked(student_id)
+            if not self._owned or self._rows + len(templates) > len(self._encodings):
+                self._grow(len(templates))
+            end = self._rows + len(templates)
+            self._encodings[self._rows:end] = templates
+            self._sq_norms[self._rows:end] = np.einsum('ij,ij->i', templates, templates)
+            self._ids.append(student_id)
+            self._index[student_id] = self._count
+            self._count += 1
+            self._offsets[self._count] = end
+            self._rows = end
+            self._publish()
+
+    def remove(self, student_id):
+        """Remove one student; returns False if it was not enrolled."""
+        with self._lock:
+            if student_id not in self._index:
+                return False
+            self._remove_locked(student_id)
+            self._publish()
+            return True
+
+    def _remove_locked(self, student_id):
+        # Older snapshots still view the current buffers, so removal copies
+        # into fresh ones instead of compacting in place
+        i = self._index[student_id]
+        start, end = self._offsets[i], self._offsets[i + 1]
+        keep = np.ones(self._rows, dtype=bool)
+        keep[start:end] = False
+        self._encodings = self._encodings[:self._rows][keep]
+        self._sq_norms = self._sq_norms[:self._rows][keep]
+        self._offsets = np.concatenate([self._offsets[:i + 1],
+                                        self._offsets[i + 2:self._count + 1] - (end - start)])
+        self._ids = self._ids[:i] + self._ids[i + 1:self._count]
+        self._index = {sid: j for j, sid in enumerate(self._ids)}
+        self._count -= 1
+        self._rows -= end - start
+        self._owned = True
+        # Rows have shifted, so indexes built on older snapshots no longer apply
+        self._epoch += 1
+
+
+def _align(offset):
+    return (offset + SNAPSHOT_ALIGN - 1) // SNAPSHOT_ALIGN * SNAPSHOT_ALIGN
+
+
+def students_digest(rows):
+    """Fingerprint of (student_id, face_encoding_path) rows used to detect stale snapshots."""
+    h = hashlib.sha256()
+    for student_id, encoding_path in sorted((str(a), str(b)) for a, b in rows):
+        h.update(student_id.encode('utf-8') + b'\0' + encoding_path.encode('utf-8') + b'\n')
+    return h.digest()
+
+
+def load_encoding_files(rows):
+    """Build a gallery from the .npy files of (student_id, face_encoding_path) rows.
+
+    Each file holds a (128,) encoding or a (K, 128) stack of templates;
+    students whose file is missing are left out.
+    """
+    student_ids = []
+    encodings = []
+    for student_id, encoding_path in rows:
+        if os.path.exists(encoding_path):
+            encodings.append(np.load(encoding_path))
+            student_ids.append(student_id)
+    return FaceGallery(student_ids, encodings)
+
+
+def write_snapshot(path, gallery, source_digest=b''):
+    """Write the gallery to a packed snapshot file, replacing any old one atomically."""
+    count = len(gallery)
+    embeddings = np.ascontiguousarray(gallery.encodings, dtype='<f4')
+    sq_norms = np.ascontiguousarray(gallery.sq_norms, dtype='<f4')
+    offsets = np.ascontiguousarray(gallery.offsets, dtype='<i8')
+    ids_blob = '\0'.join(str(sid) for sid in gallery.ids()).encode('utf-8')
+
+    embeddings_offset = _align(SNAPSHOT_HEADER.size)
+    norms_offset = _align(embeddings_offset + embeddings.nbytes)
+    offsets_offset = _align(norms_offset + sq_norms.nbytes)
+    ids_offset = offsets_offset + offsets.nbytes
+
+    body = bytearray(ids_offset + len(ids_blob) - embeddings_offset)
+    for offset, data in ((embeddings_offset, embeddings.tobytes()), (norms_offset, sq_norms.tobytes()),
+                         (offsets_offset, offsets.tobytes()), (ids_offset, ids_blob)):
+        start = offset - embeddings_offset
+        body[start:start + len(data)] = data
+    checksum = zlib.crc32(body)
+
+    header = SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, count, len(embeddings), EMBEDDING_DIM, checksum,
+        source_digest.ljust(32, b'\0')[:32],
+        embeddings_offset, norms_offset, offsets_offset, ids_offset, len(ids_blob)
+    )
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(b'\0' * (embeddings_offset - SNAPSHOT_HEADER.size))
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        # On POSIX, readers that already mapped the old file keep their
+        # pages; on Windows this fails with PermissionError while any
+        # process still has the old file mapped
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_snapshot(path, source_digest=None, verify=True):
+    """Map a snapshot file without copying it.
+
+    Returns None when the file is missing, corrupt, from another format
+    version, or was built from a different students table.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        buf = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(buf) < SNAPSHOT_HEADER.size:
+            return None
+        (magic, version, count, templates, dim, checksum, digest,
+         embeddings_offset, norms_offset, offsets_offset, ids_offset, ids_size) = SNAPSHOT_HEADER.unpack(
+            buf[:SNAPSHOT_HEADER.size].tobytes())
+
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or dim != EMBEDDING_DIM:
+            return None
+        if source_digest is not None and digest != source_digest.ljust(32, b'\0')[:32]:
+            return None
+        if len(buf) != ids_offset + ids_size:
+            return None
+        if verify and zlib.crc32(buf[embeddings_offset:]) != checksum:
+            logging.warning(f"Gallery snapshot checksum mismatch: {path}")
+            return None
+
+        encodings = buf[embeddings_offset:embeddings_offset + templates * dim * 4].view('<f4').reshape(templates, dim)
+        sq_norms = buf[norms_offset:norms_offset + templates * 4].view('<f4')
+        offsets = buf[offsets_offset:offsets_offset + (count + 1) * 8].view('<i8')
+        ids_blob = buf[ids_offset:].tobytes().decode('utf-8')
+        student_ids = ids_blob.split('\0') if count else []
+        return FaceGallery(student_ids, encodings, sq_norms, offsets)
+    except (OSError, ValueError, struct.error) as e:
+        logging.error(f"Failed to open gallery snapshot {path}: {str(e)}")
+        return None
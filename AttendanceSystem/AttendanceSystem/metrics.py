@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from config import METRICS_ENABLED
+
+# Upper bounds (seconds) of the latency histogram buckets; a last bucket
+# catches everything slower
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Latency histogram with fixed buckets: O(log buckets) per observation, no samples kept."""
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+
+    def observe(self, seconds):
+        i = bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q, state=None):
+        """Estimate a quantile by interpolating inside its bucket, as Prometheus does."""
+        counts, count, _, maximum = state or self.state()
+        if not count:
+            return None
+        rank = q * count
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if n and cumulative + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else maximum
+                return min(lower + (upper - lower) * (rank - cumulative) / n, maximum)
+            cumulative += n
+        return maximum
+
+    def state(self):
+        with self._lock:
+            return list(self.counts), self.count, self.total, self.max
+
+    def merge(self, state):
+        counts, count, total, maximum = state
+        with self._lock:
+            for i, n in enumerate(counts):
+                self.counts[i] += n
+            self.count += count
+            self.total += total
+            self.max = max(self.max, maximum)
+
+    def snapshot(self):
+        state = counts, count, total, maximum = self.state()
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            'count': count,
+            'mean_ms': ms(total / count) if count else None,
+            'p50_ms': ms(self.quantile(0.5, state)),
+            'p95_ms': ms(self.quantile(0.95, state)),
+            'p99_ms': ms(self.quantile(0.99, state)),
+            'max_ms': ms(maximum) if count else None,
+            'buckets': {str(bound): n for bound, n in zip(self.bounds + ('inf',), counts)},
+        }
+
+
+class RateMeter:
+    """Events per second over the last `window` seconds, e.g. frames for an FPS gauge."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._times = deque()
+
+    def mark(self):
+        now = time.monotonic()
+        self._times.append(now)
+        self._expire(now)
+
+    def _expire(self, now):
+        times = self._times
+        try:
+            while times[0] < now - self.window:
+                times.popleft()
+        except IndexError:
+            pass
+
+    def rate(self):
+        self._expire(time.monotonic())
+        return len(self._times) / self.window
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.histogram is not None:
+            self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Registry:
+    """Named latency histograms and counters for the hot paths.
+
+    Recording is a dict lookup, a bisect and a short lock, so it stays on
+    in production. ``snapshot`` returns plain data for logs and dumps;
+    ``take`` and ``merge`` move what a worker process recorded into the
+    parent's registry.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def histogram(self, name):
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            self.histogram(name).observe(seconds)
+
+    def timer(self, name):
+        """Context manager that records the duration of its block in histogram `name`"""
+        return _Timer(self.histogram(name) if self.enabled else None)
+
+    def count(self, name, n=1):
+        if self.enabled and n:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def counter(self, name):
+        return self._counters.get(name, 0)
+
+    def gauge(self, name, read, description=''):
+        """Register a gauge read when a snapshot is taken.
+
+        read() returns a number, or a {label value: number} dict for one
+        series per source; it runs on the reader's thread, so it must only
+        read state that is safe to read from any thread.
+        """
+        with self._lock:
+            self._gauges[name] = (read, description)
+
+    def gauges(self):
+        """{name: (value, description)} for every gauge that could be read"""
+        with self._lock:
+            gauges = dict(self._gauges)
+        values = {}
+        for name, (read, description) in sorted(gauges.items()):
+            try:
+                value = read()
+            except Exception as e:
+                logging.debug(f"Gauge {name} unavailable: {str(e)}")
+                continue
+            if value is not None:
+                values[name] = (value, description)
+        return values
+
+    def histograms(self):
+        with self._lock:
+            return dict(sorted(self._histograms.items()))
+
+    def counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def take(self):
+        """Return everything recorded so far and reset it"""
+        with self._lock:
+            histograms, counters = self._histograms, self._counters
+            self._histograms, self._counters = {}, {}
+        return {name: h.state() for name, h in histograms.items()}, counters
+
+    def merge(self, taken):
+        histograms, counters = taken
+        for name, state in histograms.items():
+            self.histogram(name).merge(state)
+        with self._lock:
+            for name, n in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + n
+
+    def snapshot(self):
+        return {
+            'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'uptime_s': round(time.time() - self.started, 3),
+            'latency': {name: h.snapshot() for name, h in self.histograms().items()},
+            'counters': self.counters(),
+            'gauges': {name: value for name, (value, _) in self.gauges().items()},
+        }
+
+    def dump(self, path):
+        """Write a snapshot as JSON, replacing the previous one atomically"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+class SnapshotDumper:
+    """Writes a registry snapshot to a file every `interval` seconds (if > 0), and once more on stop."""
+
+    def __init__(self, registry, path, interval=60.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        if interval > 0:
+            self._thread = threading.Thread(target=self._run, name='metrics-dumper', daemon=True)
+            self._thread.start()
+
+    def _dump(self):
+        try:
+            self.registry.dump(self.path)
+        except OSError as e:
+            logging.error(f"Failed to write metrics snapshot {self.path}: {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._dump()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._dump()
+
+
+# Process-wide registry used by the scan loop, the writer and the reports
+REGISTRY = Registry(enabled=METRICS_ENABLED)
+
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+count = REGISTRY.count
+snapshot = REGISTRY.snapshot
+take = REGISTRY.take
+merge = REGISTRY.merge
+gauge = REGISTRY.gauge
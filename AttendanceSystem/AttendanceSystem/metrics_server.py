@@ -0,0 +1,96 @@
+"""Prometheus-style text endpoint for the metrics registry.
+
+    curl http://127.0.0.1:9108/metrics
+
+Served by its own daemon threads; every value is read from the registry
+and its gauges at scrape time, so scraping never involves the Tk thread.
+"""
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = 'attendance_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def render(registry):
+    """Text exposition (format 0.0.4) of every histogram, counter and gauge"""
+    lines = []
+    histograms = registry.histograms()
+    if histograms:
+        name = f"{PREFIX}stage_seconds"
+        lines += [f"# HELP {name} Latency of each hot-path stage", f"# TYPE {name} histogram"]
+        for stage, histogram in histograms.items():
+            counts, count, total, _ = histogram.state()
+            label = f'stage="{_escape(stage)}"'
+            cumulative = 0
+            for bound, n in zip(histogram.bounds + (math.inf,), counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{label},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{label}}} {_number(total)}")
+            lines.append(f"{name}_count{{{label}}} {count}")
+
+    for counter, value in registry.counters().items():
+        name = f"{PREFIX}{counter}_total"
+        lines += [f"# TYPE {name} counter", f"{name} {value}"]
+
+    for gauge, (value, description) in registry.gauges().items():
+        name = f"{PREFIX}{gauge}"
+        if description:
+            lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        if isinstance(value, dict):
+            for source, source_value in sorted(value.items(), key=lambda item: str(item[0])):
+                lines.append(f'{name}{{source="{_escape(source)}"}} {_number(source_value)}')
+        else:
+            lines.append(f"{name} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render(self.server.registry).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # A scrape every few seconds would flood stderr
+        pass
+
+
+class MetricsServer:
+    """Serves GET /metrics from a background thread, bound to localhost by default."""
+
+    def __init__(self, registry, port, host='127.0.0.1'):
+        self.httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.address = self.httpd.server_address
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics on http://{host}:{self.address[1]}/metrics")
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join(timeout=5)
@@ -0,0 +1,270 @@
+"""Versioned schema migrations: python migrations.py [path/to/attendance.db] [--check]
+
+The schema version is kept in SQLite's ``PRAGMA user_version``. Each
+migration runs in its own transaction together with the version bump, so
+an interrupted upgrade leaves the database at the previous version.
+Migration 1 also accepts the schema written by the older top-level
+attendance_system.py, so any attendance.db can be brought up to date.
+
+``--rebuild-aggregates`` recomputes the statistics summary tables, e.g.
+after attendance rows were edited with the triggers disabled.
+"""
+import argparse
+import hashlib
+import logging
+import sqlite3
+import sys
+
+STUDENTS_TABLE = '''CREATE TABLE students
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT NOT NULL,
+                     student_id TEXT UNIQUE,
+                     face_encoding_path TEXT)'''
+
+ATTENDANCE_TABLE = '''CREATE TABLE attendance
+                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                       student_id TEXT,
+                       date DATE,
+                       lecture_number INTEGER,
+                       timestamp DATETIME,
+                       UNIQUE(student_id, date, lecture_number))'''
+
+ADMINS_TABLE = '''CREATE TABLE admins
+                  (username TEXT PRIMARY KEY,
+                   password TEXT)'''
+
+
+def _table_exists(conn, table):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone() is not None
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _has_unique(conn, table, columns):
+    for _, name, unique, *_ in conn.execute(f"PRAGMA index_list({table})"):
+        if unique and [row[2] for row in conn.execute(f"PRAGMA index_info({name})")] == list(columns):
+            return True
+    return False
+
+
+def _rebuild(conn, table, create_sql, copy_sql):
+    """Recreate a table with a new definition, copying rows with copy_sql"""
+    conn.execute(f"ALTER TABLE {table} RENAME TO {table}_old")
+    conn.execute(create_sql)
+    conn.execute(copy_sql)
+    conn.execute(f"DROP TABLE {table}_old")
+
+
+def unify_base_schema(conn):
+    # Students: surrogate id plus a unique student_id
+    if not _table_exists(conn, 'students'):
+        conn.execute(STUDENTS_TABLE)
+    elif 'id' not in _columns(conn, 'students'):
+        _rebuild(conn, 'students', STUDENTS_TABLE,
+                 '''INSERT INTO students (name, student_id, face_encoding_path)
+                    SELECT name, student_id, face_encoding_path FROM students_old ORDER BY rowid''')
+
+    # Attendance: one row per student per lecture; older databases may hold
+    # duplicates, of which the earliest mark is kept
+    if not _table_exists(conn, 'attendance'):
+        conn.execute(ATTENDANCE_TABLE)
+    elif not _has_unique(conn, 'attendance', ('student_id', 'date', 'lecture_number')):
+        _rebuild(conn, 'attendance', ATTENDANCE_TABLE,
+                 '''INSERT INTO attendance (id, student_id, date, lecture_number, timestamp)
+                    SELECT id, student_id, date, lecture_number, timestamp FROM attendance_old
+                    WHERE id IN (SELECT MIN(id) FROM attendance_old
+                                 GROUP BY student_id, date, lecture_number)''')
+
+    # Admins keyed by username
+    if not _table_exists(conn, 'admins'):
+        conn.execute(ADMINS_TABLE)
+    elif 'id' in _columns(conn, 'admins'):
+        _rebuild(conn, 'admins', ADMINS_TABLE,
+                 '''INSERT OR IGNORE INTO admins (username, password)
+                    SELECT username, password FROM admins_old ORDER BY id''')
+
+    # Insert default admin with hashed password
+    default_password = hashlib.sha256("admin123".encode()).hexdigest()
+    conn.execute("INSERT OR IGNORE INTO admins VALUES (?, ?)", ('admin', default_password))
+
+
+def composite_covering_indexes(conn):
+    # The single-column indexes are superseded by the composite ones below
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_student_id")
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_date")
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_lecture")
+
+    # Lecture report (date, lecture -> students in arrival order) and the
+    # per-day counts in the statistics tab
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_lecture_report
+                    ON attendance(date, lecture_number, timestamp, student_id)''')
+    # Per-student attendance history
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_student_history
+                    ON attendance(student_id, date, lecture_number, timestamp)''')
+
+
+def rebuild_aggregates(conn):
+    """Recompute the summary tables from the attendance table"""
+    conn.execute("DELETE FROM lecture_counts")
+    conn.execute("DELETE FROM student_totals")
+    conn.execute('''INSERT INTO lecture_counts (date, lecture_number, count)
+                    SELECT date, lecture_number, COUNT(*) FROM attendance
+                    GROUP BY date, lecture_number''')
+    conn.execute('''INSERT INTO student_totals (student_id, count)
+                    SELECT student_id, COUNT(*) FROM attendance GROUP BY student_id''')
+
+
+def attendance_aggregates(conn):
+    # Per-lecture head counts and per-student totals for the statistics tab.
+    # Triggers keep them current for every writer, including deletes.
+    conn.execute('''CREATE TABLE IF NOT EXISTS lecture_counts
+                    (date DATE,
+                     lecture_number INTEGER,
+                     count INTEGER NOT NULL,
+                     PRIMARY KEY (date, lecture_number)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS student_totals
+                    (student_id TEXT PRIMARY KEY,
+                     count INTEGER NOT NULL) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_student_totals_count ON student_totals(count, student_id)")
+
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_aggregates_insert
+                    AFTER INSERT ON attendance
+                    BEGIN
+                        INSERT INTO lecture_counts (date, lecture_number, count)
+                        VALUES (NEW.date, NEW.lecture_number, 1)
+                        ON CONFLICT (date, lecture_number) DO UPDATE SET count = count + 1;
+                        INSERT INTO student_totals (student_id, count)
+                        VALUES (NEW.student_id, 1)
+                        ON CONFLICT (student_id) DO UPDATE SET count = count + 1;
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_aggregates_delete
+                    AFTER DELETE ON attendance
+                    BEGIN
+                        UPDATE lecture_counts SET count = count - 1
+                        WHERE date = OLD.date AND lecture_number = OLD.lecture_number;
+                        DELETE FROM lecture_counts
+                        WHERE date = OLD.date AND lecture_number = OLD.lecture_number AND count <= 0;
+                        UPDATE student_totals SET count = count - 1 WHERE student_id = OLD.student_id;
+                        DELETE FROM student_totals WHERE student_id = OLD.student_id AND count <= 0;
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_aggregates_update
+                    AFTER UPDATE OF student_id, date, lecture_number ON attendance
+                    BEGIN
+                        UPDATE lecture_counts SET count = count - 1
+                        WHERE date = OLD.date AND lecture_number = OLD.lecture_number;
+                        DELETE FROM lecture_counts
+                        WHERE date = OLD.date AND lecture_number = OLD.lecture_number AND count <= 0;
+                        UPDATE student_totals SET count = count - 1 WHERE student_id = OLD.student_id;
+                        DELETE FROM student_totals WHERE student_id = OLD.student_id AND count <= 0;
+                        INSERT INTO lecture_counts (date, lecture_number, count)
+                        VALUES (NEW.date, NEW.lecture_number, 1)
+                        ON CONFLICT (date, lecture_number) DO UPDATE SET count = count + 1;
+                        INSERT INTO student_totals (student_id, count)
+                        VALUES (NEW.student_id, 1)
+                        ON CONFLICT (student_id) DO UPDATE SET count = count + 1;
+                    END''')
+    rebuild_aggregates(conn)
+
+
+def lecture_sessions(conn):
+    # One row per lecture actually held; attendance rows point at it
+    conn.execute('''CREATE TABLE IF NOT EXISTS lecture_sessions
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     date DATE NOT NULL,
+                     lecture_number INTEGER NOT NULL,
+                     room TEXT,
+                     started_at DATETIME NOT NULL,
+                     ended_at DATETIME,
+                     UNIQUE(date, lecture_number))''')
+    if 'session_id' not in _columns(conn, 'attendance'):
+        conn.execute("ALTER TABLE attendance ADD COLUMN session_id INTEGER REFERENCES lecture_sessions(id)")
+
+    # Lectures recorded before sessions existed become closed sessions
+    conn.execute('''INSERT OR IGNORE INTO lecture_sessions (date, lecture_number, started_at, ended_at)
+                    SELECT date, lecture_number, MIN(timestamp), MAX(timestamp) FROM attendance
+                    GROUP BY date, lecture_number''')
+    conn.execute('''UPDATE attendance SET session_id =
+                        (SELECT id FROM lecture_sessions
+                         WHERE lecture_sessions.date = attendance.date
+                         AND lecture_sessions.lecture_number = attendance.lecture_number)
+                    WHERE session_id IS NULL''')
+
+    # "Who attended session X", in arrival order
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_session
+                    ON attendance(session_id, timestamp, student_id)''')
+
+
+# (version, description, function) in the order they must be applied
+MIGRATIONS = [
+    (1, "Unified students/attendance/admins schema", unify_base_schema),
+    (2, "Composite covering indexes for reports, statistics and history", composite_covering_indexes),
+    (3, "Incrementally maintained attendance aggregates", attendance_aggregates),
+    (4, "Lecture sessions referenced by attendance marks", lecture_sessions),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=SCHEMA_VERSION):
+    """Apply every pending migration up to target; returns the versions applied"""
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version <= schema_version(conn) or version > target:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            upgrade(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logging.info(f"Database migrated to version {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bring an attendance database up to the current schema")
+    parser.add_argument('db_path', nargs='?', help="Database to migrate (default: DB_PATH from config)")
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help="Recompute the statistics summary tables from the attendance table")
+    parser.add_argument('--check', action='store_true',
+                        help="Also verify that no hot query needs a full table scan")
+    args = parser.parse_args(argv)
+
+    from config import DB_PATH
+    from database import check_query_plans
+    db_path = args.db_path or DB_PATH
+    conn = sqlite3.connect(db_path)
+    try:
+        before = schema_version(conn)
+        applied = migrate(conn)
+        print(f"{db_path}: schema version {before} -> {schema_version(conn)}"
+              + (f" (applied {', '.join(map(str, applied))})" if applied else " (up to date)"))
+        if args.rebuild_aggregates:
+            with conn:
+                rebuild_aggregates(conn)
+            print("Rebuilt attendance aggregates")
+        if args.check:
+            problems = check_query_plans(conn)
+            for name, steps in problems.items():
+                print(f"Full scan in {name}: {'; '.join(steps)}")
+            if problems:
+                return 1
+            print("All hot queries use indexes")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import time
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap background-subtraction check that decides when to run detection.
+
+    Each frame is shrunk to a small grayscale thumbnail and compared with a
+    running-average background. Face detection only runs while enough
+    pixels are changing (and for ``hold`` seconds afterwards, so someone who
+    walks up and stops is still recognized). After ``idle_timeout`` seconds
+    without motion the gate only looks at one frame every
+    ``idle_poll_interval`` seconds.
+    """
+
+    def __init__(self, width=160, threshold=25, min_area=0.01, hold=2.0,
+                 idle_timeout=60.0, idle_poll_interval=1.0, learning_rate=0.05):
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.hold = hold
+        self.idle_timeout = idle_timeout
+        self.idle_poll_interval = idle_poll_interval
+        self.learning_rate = learning_rate
+        self.background = None
+        self.last_motion = time.time()
+
+    def _thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, int(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _moving(self, frame):
+        """Thumbnail mask of pixels that differ from the background, which then learns the frame.
+
+        None for the first frame (or after a change of frame size).
+        """
+        gray = self._thumbnail(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+            return None
+        moving = cv2.absdiff(gray, cv2.convertScaleAbs(self.background)) > self.threshold
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return moving
+
+    def check(self, frame, now=None):
+        """Return True if the frame should go through face detection."""
+        now = time.time() if now is None else now
+        moving = self._moving(frame)
+        if moving is None or np.count_nonzero(moving) / moving.size >= self.min_area:
+            self.last_motion = now
+            return True
+        return now - self.last_motion < self.hold
+
+    def changed_regions(self, frame, min_size=4):
+        """(top, right, bottom, left) boxes in frame pixels around the areas that are changing.
+
+        Blobs smaller than ``min_size`` thumbnail pixels are ignored; None
+        for the first frame, when there is nothing to compare with.
+        """
+        moving = self._moving(frame)
+        if moving is None:
+            return None
+        ratio = frame.shape[1] / moving.shape[1]
+        moving = cv2.dilate(moving.astype(np.uint8), np.ones((5, 5), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(moving)
+        return [(int(y * ratio), int((x + w) * ratio), int((y + h) * ratio), int(x * ratio))
+                for x, y, w, h, _ in stats[1:count] if w >= min_size and h >= min_size]
+
+    def is_idle(self, now=None):
+        now = time.time() if now is None else now
+        return now - self.last_motion > self.idle_timeout
+
+    def poll_delay(self, now=None):
+        """Seconds to wait before looking at the next frame."""
+        return self.idle_poll_interval if self.is_idle(now) else 0.0
@@ -0,0 +1,275 @@
+import heapq
+import threading
+import time
+import logging
+import cv2
+from functools import partial
+from collections import deque, namedtuple
+import metrics
+
+Frame = namedtuple('Frame', ['seq', 'timestamp', 'image'])
+Result = namedtuple('Result', ['seq', 'timestamp', 'faces'])
+
+
+class LatestQueue:
+    """Bounded queue where a put on a full queue drops the oldest item.
+
+    Consumers therefore always see the most recent frames, and a slow stage
+    can never build up a backlog behind it. ``put(item, block=True)`` waits
+    for room instead, for offline sources where every frame matters.
+    Drops are also counted in the metrics counter ``drop_metric``, if given.
+    """
+
+    def __init__(self, maxsize=1, drop_metric=None):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.drop_metric = drop_metric
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def put(self, item, block=False):
+        with self._cond:
+            while block and len(self._items) == self._items.maxlen and not self._closed:
+                self._cond.wait(0.1)
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self.drop_metric:
+                    metrics.count(self.drop_metric)
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Return the oldest queued item, or None on timeout or close."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            # Wake a producer blocked on a full queue
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class ReorderBuffer:
+    """Releases results in ticket order even when workers finish out of order."""
+
+    def __init__(self):
+        self._heap = []
+        self._next = 0
+
+    def push(self, ticket, item):
+        heapq.heappush(self._heap, (ticket, item))
+        ready = []
+        while self._heap and self._heap[0][0] == self._next:
+            ready.append(heapq.heappop(self._heap)[1])
+            self._next += 1
+        return ready
+
+
+class ScanPipeline:
+    """Capture and recognition threads feeding a UI consumer.
+
+    The capture thread reads frames as fast as the camera delivers them and
+    offers each one to the display queue and the recognition queue. The
+    recognition thread takes the newest frame, runs ``recognize(image)``
+    and posts the faces to the results queue. The UI only polls
+    ``display`` and ``results`` and never blocks on the camera or dlib.
+
+    With a RecognitionPool, the recognition thread instead keeps up to one
+    frame per worker in flight and results are re-ordered by dispatch
+    order before they are posted; ``detector`` (this camera's FaceDetector)
+    prepares each frame before it is sent.
+
+    An optional MotionGate skips recognition on frames where nothing moves.
+
+    With ``realtime=False`` (recorded video) no frame or result is dropped:
+    the capture thread waits for the recognition stage, and ``finished``
+    is set once the whole file has been processed. The motion gate then
+    runs on video time and never throttles, so static stretches are
+    skipped at full speed.
+    """
+
+    def __init__(self, capture, recognize, max_fps=3, pool=None, gate=None, realtime=True, stride=1,
+                 detector=None):
+        self.capture = capture
+        self.recognize = recognize
+        self.pool = pool
+        self.detector = detector
+        self.gate = gate
+        self.realtime = realtime
+        self.stride = max(1, stride)
+        # Recorded video runs on its own clock: the motion gate's hold and
+        # idle timeout count video seconds, at the file's frame rate
+        self.video_fps = (capture.get(cv2.CAP_PROP_FPS) or 30.0) if not realtime else None
+        self.finished = threading.Event()
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.display = LatestQueue(1)
+        self.pending = LatestQueue(1, drop_metric='frames_dropped')
+        self.results = LatestQueue(8, drop_metric='results_dropped')
+        self.running = False
+        self.frames = 0
+        self.skipped = 0
+        # Live rates and the frames handed to recognition but not finished,
+        # read by the metrics gauges from other threads
+        self.capture_rate = metrics.RateMeter()
+        self.recognition_rate = metrics.RateMeter()
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.running = True
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='capture', daemon=True),
+            threading.Thread(target=self._dispatch_loop if self.pool else self._recognition_loop,
+                             name='recognition', daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def queue_depth(self):
+        """Frames waiting for or inside the recognition stage"""
+        return len(self.pending) + self.in_flight
+
+    def _track_in_flight(self, n):
+        with self._in_flight_lock:
+            self.in_flight += n
+
+    def stop(self):
+        self.running = False
+        self.pending.close()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2)
+        if self.capture.isOpened():
+            self.capture.release()
+        self.display.close()
+        self.results.close()
+
+    def _capture_loop(self):
+        seq = 0
+        while self.running:
+            with metrics.timer('capture'):
+                ret, frame = self.capture.read()
+            if not ret or frame is None:
+                if not self.realtime:
+                    # End of a recorded video: let recognition drain and stop
+                    self.pending.close()
+                    break
+                time.sleep(0.01)
+                continue
+            seq += 1
+            self.frames = seq
+            metrics.count('frames_captured')
+            self.capture_rate.mark()
+            if (seq - 1) % self.stride:
+                continue
+            item = Frame(seq, time.time(), frame)
+            self.display.put(item)
+            self.pending.put(item, block=not self.realtime)
+
+    def _next_frame(self, last_processed):
+        item = self.pending.get(timeout=0.1)
+        if item is None:
+            return None
+        wait = self.min_interval - (time.time() - last_processed)
+        if self.gate is not None and self.realtime:
+            # Idle kiosks only look at one frame per poll interval
+            wait = max(wait, self.gate.poll_delay())
+        if wait > 0:
+            time.sleep(wait)
+            # A newer frame may have arrived while we were throttled
+            item = self.pending.get(timeout=0) or item
+        now = None if self.realtime else item.seq / self.video_fps
+        if self.gate is not None and not self.gate.check(item.image, now):
+            self.skipped += 1
+            metrics.count('frames_skipped')
+            return None
+        return item
+
+    def _drained(self):
+        return self.pending.closed and len(self.pending) == 0
+
+    def _recognition_loop(self):
+        last_processed = 0.0
+        while self.running:
+            item = self._next_frame(last_processed)
+            if item is None:
+                if self._drained():
+                    break
+                continue
+            last_processed = time.time()
+            self._track_in_flight(1)
+            try:
+                with metrics.timer('recognition'):
+                    faces = self.recognize(item.image)
+            except Exception as e:
+                logging.error(f"Recognition error: {str(e)}")
+                metrics.count('recognition_errors')
+                continue
+            finally:
+                self._track_in_flight(-1)
+            metrics.count('frames_processed')
+            self.recognition_rate.mark()
+            self.results.put(Result(item.seq, item.timestamp, faces), block=not self.realtime)
+        self.finished.set()
+
+    def _dispatch_loop(self):
+        in_flight = threading.Semaphore(self.pool.workers)
+        reorder = ReorderBuffer()
+        reorder_lock = threading.Lock()
+        ticket = 0
+        last_processed = 0.0
+        while self.running:
+            if not in_flight.acquire(timeout=0.1):
+                continue
+            item = self._next_frame(last_processed)
+            if item is None:
+                in_flight.release()
+                if self._drained():
+                    break
+                continue
+            last_processed = time.time()
+            self._track_in_flight(1)
+            future = self.pool.submit(item.image, self.detector)
+            future.add_done_callback(partial(self._on_encoded, ticket, item, in_flight, reorder, reorder_lock))
+            ticket += 1
+        # Wait for the frames still in flight before reporting completion
+        for _ in range(self.pool.workers):
+            in_flight.acquire(timeout=5)
+        self.finished.set()
+
+    def _on_encoded(self, ticket, item, in_flight, reorder, reorder_lock, future):
+        try:
+            encoded = future.result()
+        except Exception as e:
+            logging.error(f"Recognition worker error: {str(e)}")
+            encoded = None
+        try:
+            with reorder_lock:
+                # Matching happens in ticket order, so marks follow frame order
+                for ready_item, ready_encoded in reorder.push(ticket, (item, encoded)):
+                    if ready_encoded is None:
+                        metrics.count('recognition_errors')
+                        continue
+                    metrics.count('frames_processed')
+                    self.recognition_rate.mark()
+                    faces = self.pool.to_results(ready_encoded)
+                    self.results.put(Result(ready_item.seq, ready_item.timestamp, faces), block=not self.realtime)
+        finally:
+            self._track_in_flight(-1)
+            in_flight.release()
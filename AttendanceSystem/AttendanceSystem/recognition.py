@@ -0,0 +1,63 @@
+import cv2
+import face_recognition
+from collections import namedtuple
+from config import MATCH_TOLERANCE
+from detection import frame_boxes
+import metrics
+
+# One face found in a frame. box is (top, right, bottom, left) in the
+# coordinates of the full-size frame; student_id is None for unknown faces.
+# track_id is set when the face comes from the FaceTracker.
+FaceResult = namedtuple('FaceResult', ['box', 'student_id', 'distance', 'track_id'], defaults=(None,))
+
+
+def detect_and_encode(prepared, detector):
+    """Find and encode faces in a frame already cut down by detector.prepare().
+
+    Returns the face boxes mapped back to full-frame coordinates and the
+    128-d encodings. This is the CPU-heavy part and is what the process
+    pool runs in its workers.
+    """
+    face_locations = detector.locate(prepared)
+    metrics.count('faces_detected', len(face_locations))
+    with metrics.timer('encoding'):
+        face_encodings = face_recognition.face_encodings(prepared.rgb, face_locations)
+    return frame_boxes(prepared, face_locations), face_encodings
+
+
+def match_detections(boxes, face_encodings, match_faces, tolerance=MATCH_TOLERANCE):
+    """Turn detected faces into FaceResults using one batched gallery match."""
+    # One matrix operation matches every face in the frame
+    face_matches = match_faces(face_encodings)
+
+    results = []
+    for box, match in zip(boxes, face_matches):
+        recognized = match.student_id is not None and match.distance <= tolerance
+        results.append(FaceResult(box, match.student_id if recognized else None, match.distance))
+    metrics.count('faces_unknown', sum(face.student_id is None for face in results))
+    return results
+
+
+def recognize_faces(frame, match_faces, detector, tolerance=MATCH_TOLERANCE):
+    """Detect, encode and match every face in a BGR frame."""
+    boxes, face_encodings = detect_and_encode(detector.prepare(frame), detector)
+    return match_detections(boxes, face_encodings, match_faces, tolerance)
+
+
+def draw_faces(frame, faces, ratio=1.0, names=None):
+    """Draw boxes and labels for recognized (green) and unknown (red) faces.
+
+    names maps student IDs to display names (a dict or StudentDirectory);
+    faces without an entry are labelled with their ID.
+    """
+    for face in faces:
+        top, right, bottom, left = (int(v * ratio) for v in face.box)
+        color = (0, 255, 0) if face.student_id else (0, 0, 255)
+        cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+        if face.student_id:
+            label = names.get(face.student_id, face.student_id) if names else face.student_id
+        else:
+            label = "Unknown"
+        cv2.putText(frame, label, (left + 6, bottom - 6),
+                    cv2.FONT_HERSHEY_DUPLEX, 0.8, color, 1)
+    return frame
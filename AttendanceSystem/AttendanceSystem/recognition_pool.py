@@ -0,0 +1,58 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from config import MATCH_TOLERANCE
+from recognition import detect_and_encode, match_detections
+import metrics
+
+
+_detector = None
+
+
+def _init_worker(detector):
+    # face_recognition loads the dlib HOG detector, landmark and encoder
+    # models when a worker imports this module (through recognition), so
+    # each worker pays for that exactly once
+    global _detector
+    _detector = detector
+
+
+def _encode(prepared):
+    boxes, face_encodings = detect_and_encode(prepared, _detector)
+    # The worker's stage timings travel back with the result
+    return boxes, [encoding.astype('float32') for encoding in face_encodings], metrics.take()
+
+
+class RecognitionPool:
+    """Process pool that runs HOG detection and face encoding on N cores.
+
+    The parent crops each frame to its camera's ROI and downscales it with
+    that camera's detector before sending it, so only the small RGB image
+    crosses the process boundary; the workers' own ``detector`` supplies
+    the detection settings. Matching against the gallery stays in the
+    parent where the gallery lives.
+    """
+
+    def __init__(self, workers, match_faces, detector, tolerance=MATCH_TOLERANCE):
+        self.workers = workers
+        self.match_faces = match_faces
+        self.tolerance = tolerance
+        # spawn keeps workers free of the parent's Tk and camera handles
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(detector,),
+        )
+        logging.info(f"Started recognition pool with {workers} workers")
+
+    def submit(self, frame, detector):
+        return self.executor.submit(_encode, detector.prepare(frame))
+
+    def to_results(self, encoded):
+        boxes, face_encodings, worker_metrics = encoded
+        metrics.merge(worker_metrics)
+        return match_detections(boxes, face_encodings, self.match_faces, self.tolerance)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
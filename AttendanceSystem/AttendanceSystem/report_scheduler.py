@@ -0,0 +1,116 @@
+import threading
+import time
+import logging
+import metrics
+
+
+class ReportScheduler:
+    """Rebuilds lecture PDF reports in the background, coalescing requests.
+
+    ``request(date, lecture)`` only marks the report dirty; it is built
+    ``delay`` seconds after the last request for that lecture, so a rush of
+    arrivals costs one build instead of one per student. Builds run one at
+    a time on a single worker thread, so a lecture never has more than one
+    build in flight; a request that arrives during a build schedules
+    another one after it. ``flush`` makes every dirty report due at once,
+    which is how a closing scan session gets its final, complete report.
+
+    ``max_wait``, if set, bounds how long a report stays dirty: a steady
+    stream of arrivals keeps pushing the debounce back, but the report is
+    still rebuilt ``max_wait`` seconds after its first unbuilt request.
+    """
+
+    def __init__(self, build, delay=10.0, max_wait=None):
+        self.build = build
+        self.delay = delay
+        self.max_wait = max_wait
+        self.builds = 0
+        self.last_build_seconds = None
+        self.last_build_time = None
+        self._due = {}
+        # When each dirty report got its first request since its last build
+        self._dirty_since = {}
+        self._building = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='report-scheduler', daemon=True)
+        self._thread.start()
+
+    def request(self, date, lecture_num):
+        with self._cond:
+            key = (date, lecture_num)
+            now = time.time()
+            due = now + self.delay
+            if self.max_wait is not None:
+                due = min(due, self._dirty_since.setdefault(key, now) + self.max_wait)
+            self._due[key] = due
+            self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            now = time.time()
+            for key in self._due:
+                self._due[key] = now
+            self._cond.notify_all()
+
+    @property
+    def pending(self):
+        # Read by the metrics gauges without the lock: two plain attribute
+        # reads, so a scrape never waits behind a request or a build
+        return len(self._due) + (self._building is not None)
+
+    def wait(self, timeout=None):
+        """Block until no build is due or running; returns False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._due or self._building is not None:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=30.0):
+        """Build everything still dirty, then stop the worker"""
+        self.flush()
+        self.wait(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next_due(self):
+        with self._cond:
+            while not self._closed:
+                if self._due:
+                    key, due = min(self._due.items(), key=lambda item: item[1])
+                    if due <= time.time():
+                        del self._due[key]
+                        self._dirty_since.pop(key, None)
+                        self._building = key
+                        return key
+                    self._cond.wait(due - time.time())
+                else:
+                    self._cond.wait()
+            return None
+
+    def _run(self):
+        while True:
+            key = self._next_due()
+            if key is None:
+                return
+            start = time.time()
+            try:
+                self.build(*key)
+                self.builds += 1
+                self.last_build_seconds = time.time() - start
+                self.last_build_time = time.time()
+                metrics.observe('report_build', self.last_build_seconds)
+                logging.info(f"Rebuilt report for {key[0]} lecture {key[1]} in {self.last_build_seconds:.2f}s")
+            except Exception as e:
+                metrics.count('report_errors')
+                logging.error(f"Error building report for {key[0]} lecture {key[1]}: {str(e)}")
+            finally:
+                with self._cond:
+                    self._building = None
+                    self._cond.notify_all()
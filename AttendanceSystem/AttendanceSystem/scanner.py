@@ -0,0 +1,443 @@
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from functools import partial
+import logging
+from datetime import datetime
+from config import REPORTS_DIR, GALLERY_SNAPSHOT_PATH, GALLERY_SNAPSHOT_DEBOUNCE
+from config import ANN_ENABLED, ANN_MIN_GALLERY_SIZE, ANN_INDEX_PATH, ANN_N_LISTS, ANN_N_PROBE, ANN_RERANK
+from config import ANN_RETRY_INTERVAL
+from config import RECOGNITION_FPS, RECOGNITION_WORKERS
+from config import DETECTOR_BACKEND, DETECTOR_CASCADE_PATH
+from config import DETECTION_ROI, DETECTION_SCALE, DETECTION_UPSAMPLE, DETECTION_COARSE_SCALE
+from config import DETECTION_COARSE_UPSAMPLE, DETECTION_COARSE_THRESHOLD, DETECTION_REFINE_MARGIN
+from config import TRACKING_ENABLED, TRACK_IOU_THRESHOLD, TRACK_MAX_AGE, TRACK_REVERIFY_INTERVAL, TRACK_UNKNOWN_RETRY
+from config import MOTION_GATE_ENABLED, MOTION_THRESHOLD, MOTION_MIN_AREA, MOTION_HOLD
+from config import MOTION_IDLE_TIMEOUT, MOTION_IDLE_POLL_INTERVAL
+from config import ATTENDANCE_WRITE_BATCH, ATTENDANCE_FLUSH_INTERVAL, REPORT_DEBOUNCE, REPORT_MAX_WAIT
+from config import METRICS_SNAPSHOT_PATH, METRICS_DUMP_INTERVAL, METRICS_HTTP_PORT, METRICS_HTTP_HOST
+from gallery import GalleryStore, students_digest, load_snapshot, load_encoding_files, write_snapshot
+from ann_index import IVFIndex
+from recognition import recognize_faces
+from detection import FaceDetector, create_backend
+from pipeline import ScanPipeline
+from recognition_pool import RecognitionPool
+from tracker import FaceTracker, TrackingRecognizer
+from motion import MotionGate
+from camera import open_capture, is_live
+from student_directory import StudentDirectory
+import database
+from attendance_writer import AttendanceWriter
+from report_scheduler import ReportScheduler
+from snapshot_writer import SnapshotWriter
+import metrics
+from metrics_server import MetricsServer
+
+
+class CameraSession:
+    """One video source in a scan: its capture, pipeline and dedup set.
+
+    Every source has its own ``marked_students`` so two doors never hide
+    each other's arrivals, while all sessions share the Scanner's gallery.
+    """
+
+    def __init__(self, source, capture, pipeline):
+        self.source = source
+        self.capture = capture
+        self.pipeline = pipeline
+        self.marked_students = set()
+        self.last_faces = []
+
+    def start(self):
+        self.pipeline.start()
+
+    def stop(self):
+        self.pipeline.stop()
+
+    @property
+    def finished(self):
+        return self.pipeline.finished.is_set() and len(self.pipeline.results) == 0
+
+    def new_arrivals(self, faces):
+        """Recognized faces whose students this source has not marked yet"""
+        self.last_faces = faces
+        arrivals = []
+        for face in faces:
+            if face.student_id and face.student_id not in self.marked_students:
+                self.marked_students.add(face.student_id)
+                arrivals.append(face)
+        return arrivals
+
+
+class Scanner:
+    """Recognition engine shared by the Tk kiosk and the headless CLI.
+
+    Owns the face gallery, matching, the scan pipeline factories and the
+    attendance/report writes, and never touches Tkinter.
+    """
+
+    def __init__(self):
+        self.gallery_store = GalleryStore()
+        self.students = StudentDirectory()
+        self.snapshot_lock = threading.Lock()
+        # Lectures being closed in the background (see close_lecture)
+        self.closing = []
+        self.snapshot_writer = SnapshotWriter(self._write_gallery_snapshot, GALLERY_SNAPSHOT_DEBOUNCE)
+        self.ann_index = None
+        self.ann_building = False
+        self.ann_failed_at = None
+        self.recognition_pool = None
+        self.report_scheduler = ReportScheduler(self.generate_attendance_report, REPORT_DEBOUNCE,
+                                                REPORT_MAX_WAIT)
+        self.attendance_writer = AttendanceWriter(ATTENDANCE_WRITE_BATCH, ATTENDANCE_FLUSH_INTERVAL,
+                                                  on_commit=self.schedule_reports)
+        # Sessions are only referenced weakly; a stopped one drops out of the gauges
+        self.camera_sessions = weakref.WeakSet()
+        self.metrics_server = None
+        self.metrics_dumper = None
+        if metrics.REGISTRY.enabled:
+            self.register_gauges()
+            self.metrics_dumper = metrics.SnapshotDumper(metrics.REGISTRY, METRICS_SNAPSHOT_PATH,
+                                                         METRICS_DUMP_INTERVAL)
+
+    def register_gauges(self):
+        # Read by the metrics dumper and endpoint threads: only attribute
+        # reads and lengths, no locks shared with the scan loop or Tk
+        def per_source(read):
+            return lambda: {str(session.source): read(session.pipeline)
+                            for session in list(self.camera_sessions) if session.pipeline.running}
+
+        def gallery_bytes():
+            gallery = self.gallery_store.snapshot
+            return gallery.encodings.nbytes + gallery.sq_norms.nbytes + gallery.offsets.nbytes
+
+        gauge = metrics.gauge
+        gauge('capture_fps', per_source(lambda p: p.capture_rate.rate()), "Frames read per second")
+        gauge('recognition_fps', per_source(lambda p: p.recognition_rate.rate()), "Frames recognized per second")
+        gauge('recognition_queue_depth', per_source(lambda p: p.queue_depth),
+              "Frames waiting for or inside recognition")
+        gauge('gallery_students', lambda: len(self.gallery_store.snapshot), "Students in the live gallery")
+        gauge('gallery_templates', lambda: self.gallery_store.snapshot.n_templates, "Face templates in the live gallery")
+        gauge('gallery_bytes', gallery_bytes, "Memory held by the gallery matrix")
+        gauge('pending_writes', lambda: self.attendance_writer.pending, "Attendance marks not yet committed")
+        gauge('reports_pending', lambda: self.report_scheduler.pending, "Reports due or being built")
+        gauge('report_last_build_seconds', lambda: self.report_scheduler.last_build_seconds,
+              "Duration of the last report build")
+        gauge('report_last_build_timestamp', lambda: self.report_scheduler.last_build_time,
+              "Unix time of the last report build")
+        gauge('uptime_seconds', lambda: time.time() - metrics.REGISTRY.started)
+
+    def start_metrics_server(self):
+        """Serve /metrics on localhost if METRICS_HTTP_PORT is set; a busy port is logged, not fatal"""
+        if not METRICS_HTTP_PORT or not metrics.REGISTRY.enabled or self.metrics_server:
+            return
+        try:
+            self.metrics_server = MetricsServer(metrics.REGISTRY, METRICS_HTTP_PORT, METRICS_HTTP_HOST)
+        except OSError as e:
+            logging.error(f"Could not start metrics endpoint on port {METRICS_HTTP_PORT}: {str(e)}")
+
+    def load_encodings_cache(self):
+        """Load the gallery; returns False (and logs) if it could not be loaded"""
+        try:
+            students = database.get_student_encodings()
+
+            # Cold start maps the packed snapshot; it is only rebuilt from the
+            # per-student .npy files when the students table has changed
+            digest = students_digest(students)
+            gallery = load_snapshot(GALLERY_SNAPSHOT_PATH, digest)
+            if gallery is None:
+                gallery = load_encoding_files(students)
+                # The snapshot only speeds up the next start; failing to write
+                # it (full disk, read-only folder, file mapped by another
+                # process on Windows) must not lose the gallery just built
+                try:
+                    with self.snapshot_lock:
+                        write_snapshot(GALLERY_SNAPSHOT_PATH, gallery, digest)
+                    logging.info(f"Rebuilt gallery snapshot with {gallery.n_templates} templates")
+                except Exception as e:
+                    logging.error(f"Error saving gallery snapshot: {str(e)}")
+            self.gallery_store.replace(gallery)
+            self.students.replace(database.get_student_metadata())
+            logging.info(f"Loaded {gallery.n_templates} face templates for {len(gallery)} students")
+
+            if ANN_ENABLED and len(gallery) >= ANN_MIN_GALLERY_SIZE:
+                self.ann_index = IVFIndex.load(ANN_INDEX_PATH, self.gallery_store.snapshot)
+                self.refresh_ann_index()
+            return True
+        except Exception as e:
+            logging.error(f"Error loading encodings cache: {str(e)}")
+            return False
+
+    def match_faces(self, face_encodings):
+        """Match all faces of a frame, through the ANN index for large galleries"""
+        gallery = self.gallery_store.snapshot
+        with metrics.timer('matching'):
+            if ANN_ENABLED and len(gallery) >= ANN_MIN_GALLERY_SIZE:
+                index = self.ann_index
+                if index is not None and index.covers(gallery):
+                    return index.match(gallery, face_encodings, n_probe=ANN_N_PROBE, rerank=ANN_RERANK)
+            return gallery.match(face_encodings)
+
+    def ann_index_stale(self):
+        gallery = self.gallery_store.snapshot
+        if not ANN_ENABLED or len(gallery) < ANN_MIN_GALLERY_SIZE:
+            return False
+        index = self.ann_index
+        # Rows enrolled since the build are matched exactly; past 10% the
+        # exact tail costs more than re-clustering
+        return index is None or not index.covers(gallery) or gallery.n_templates > 1.1 * index.size
+
+    def refresh_ann_index(self):
+        """Rebuild the ANN index in the background if it no longer fits the gallery"""
+        if self.ann_index_stale():
+            self.build_ann_index()
+
+    def build_ann_index(self):
+        if self.ann_building:
+            return
+        # A failing build (e.g. out of memory) is not retried on every change
+        if self.ann_failed_at is not None and time.time() - self.ann_failed_at < ANN_RETRY_INTERVAL:
+            return
+        self.ann_building = True
+        threading.Thread(target=self._build_ann_index, name='ann-index', daemon=True).start()
+
+    def _build_ann_index(self):
+        try:
+            # The gallery may change during a build; go again until it fits
+            while self.ann_index_stale():
+                gallery = self.gallery_store.snapshot
+                start = time.time()
+                index = IVFIndex.build(gallery, n_lists=ANN_N_LISTS)
+                self.ann_index = index
+                index.save(ANN_INDEX_PATH)
+                logging.info(f"Built ANN index over {index.size} templates in {time.time() - start:.1f}s")
+            self.ann_failed_at = None
+        except Exception as e:
+            self.ann_failed_at = time.time()
+            logging.error(f"Error building ANN index: {str(e)}")
+        finally:
+            self.ann_building = False
+
+    def _drop_from_ann_index(self, previous, student_id):
+        """Carry the ANN index over a student's removal from the `previous` snapshot"""
+        index = self.ann_index
+        if index is None or not index.covers(previous):
+            return
+        i = previous.ids().index(student_id)
+        start, end = int(previous.offsets[i]), int(previous.offsets[i + 1])
+        index = index.without_rows(start, end, self.gallery_store.snapshot)
+        self.ann_index = index
+        try:
+            index.save(ANN_INDEX_PATH)
+        except OSError as e:
+            logging.error(f"Error saving ANN index: {str(e)}")
+
+    def register_encoding(self, student_id, encoding, name=None):
+        """Add a newly registered student (one encoding or a (K, 128) stack of templates)
+        to the live gallery without a reload"""
+        self.students.set(student_id, name)
+        previous = self.gallery_store.snapshot
+        reenrolled = str(student_id) in self.gallery_store
+        self.gallery_store.add(str(student_id), encoding)
+        if reenrolled:
+            # Re-enrollment drops the old templates before appending the new
+            self._drop_from_ann_index(previous, str(student_id))
+        logging.info(f"Gallery updated: added {student_id} ({len(self.gallery_store)} students)")
+        self.save_gallery_snapshot()
+        self.refresh_ann_index()
+
+    def unregister_encoding(self, student_id):
+        """Drop a deleted student from the live gallery without a reload"""
+        self.students.remove(student_id)
+        previous = self.gallery_store.snapshot
+        if self.gallery_store.remove(str(student_id)):
+            logging.info(f"Gallery updated: removed {student_id} ({len(self.gallery_store)} students)")
+            self._drop_from_ann_index(previous, str(student_id))
+            self.save_gallery_snapshot()
+            self.refresh_ann_index()
+
+    def save_gallery_snapshot(self):
+        """Mark the on-disk snapshot stale; the snapshot writer rewrites it once things settle"""
+        self.snapshot_writer.request()
+
+    def _write_gallery_snapshot(self):
+        # Runs on the snapshot writer thread; the lock only guards against
+        # the cold-start rebuild in load_encodings_cache
+        with self.snapshot_lock:
+            gallery = self.gallery_store.snapshot
+            students = database.get_student_encodings()
+
+            # Skip if the DB and the gallery disagree; the add/remove that
+            # is still in flight will request another write
+            if set(gallery.ids()) != {str(student_id) for student_id, _ in students}:
+                return
+            write_snapshot(GALLERY_SNAPSHOT_PATH, gallery, students_digest(students))
+
+    def recognize_frame(self, frame, detector):
+        """Recognition stage of the scan pipeline; runs on the worker thread"""
+        return recognize_faces(frame, self.match_faces, detector)
+
+    def create_detector(self, source=None):
+        """Face detector for one camera, cropped to that camera's DETECTION_ROI entry"""
+        roi = DETECTION_ROI
+        if isinstance(roi, dict):
+            roi = roi.get(source, roi.get(str(source)))
+        backend = create_backend(DETECTOR_BACKEND, DETECTOR_CASCADE_PATH)
+        # The coarse pass only proposes, so HOG may accept weaker faces there
+        coarse_backend = create_backend(DETECTOR_BACKEND, DETECTOR_CASCADE_PATH,
+                                        hog_threshold=DETECTION_COARSE_THRESHOLD)
+        return FaceDetector(backend, scale=DETECTION_SCALE, upsample=DETECTION_UPSAMPLE, roi=roi,
+                            coarse_scale=DETECTION_COARSE_SCALE, coarse_upsample=DETECTION_COARSE_UPSAMPLE,
+                            coarse_backend=coarse_backend, refine_margin=DETECTION_REFINE_MARGIN,
+                            motion_threshold=MOTION_THRESHOLD)
+
+    def create_recognizer(self, detector):
+        if TRACKING_ENABLED:
+            # A fresh tracker per session so identities never leak between lectures
+            tracker = FaceTracker(TRACK_IOU_THRESHOLD, TRACK_MAX_AGE,
+                                  TRACK_REVERIFY_INTERVAL, TRACK_UNKNOWN_RETRY)
+            return TrackingRecognizer(self.match_faces, detector, tracker=tracker)
+        return partial(self.recognize_frame, detector=detector)
+
+    def create_gate(self):
+        if not MOTION_GATE_ENABLED:
+            return None
+        return MotionGate(threshold=MOTION_THRESHOLD, min_area=MOTION_MIN_AREA, hold=MOTION_HOLD,
+                          idle_timeout=MOTION_IDLE_TIMEOUT, idle_poll_interval=MOTION_IDLE_POLL_INTERVAL)
+
+    def create_pipeline(self, capture, realtime=True, stride=1, source=None):
+        if RECOGNITION_WORKERS > 1 and self.recognition_pool is None:
+            # Workers load the dlib models once and are reused across sessions
+            self.recognition_pool = RecognitionPool(RECOGNITION_WORKERS, self.match_faces, self.create_detector())
+        # One detector per camera: it holds that camera's ROI and previous frame
+        detector = self.create_detector(source)
+        # Recorded video is processed as fast as possible, without dropping frames
+        return ScanPipeline(capture, self.create_recognizer(detector), max_fps=RECOGNITION_FPS if realtime else 0,
+                            pool=self.recognition_pool, gate=self.create_gate(),
+                            realtime=realtime, stride=stride, detector=detector)
+
+    def open_session(self, source, width=1280, height=720, stride=1):
+        """Open one camera or video file with its own pipeline; None if unavailable"""
+        capture = open_capture(source, width, height)
+        if capture is None:
+            logging.error(f"Could not open video source {source}")
+            return None
+        pipeline = self.create_pipeline(capture, realtime=is_live(source), stride=stride, source=source)
+        session = CameraSession(source, capture, pipeline)
+        self.camera_sessions.add(session)
+        return session
+
+    def open_lecture(self, lecture_num=None, room=None):
+        """Start a lecture session for today; None allocates the next lecture number"""
+        session = database.open_lecture_session(datetime.now().strftime("%Y-%m-%d"), room, lecture_num)
+        logging.info(f"Opened session {session.id}: lecture {session.lecture_number} on {session.date}"
+                     f"{f' in {room}' if room else ''}")
+        return session
+
+    def close_lecture(self, session):
+        """End a lecture without blocking the caller; returns the worker thread.
+
+        The worker commits the marks still queued for the session, closes
+        its row and makes its reports due, in that order.
+        """
+        self.closing = [thread for thread in self.closing if thread.is_alive()]
+        thread = threading.Thread(target=self._close_lecture, args=(session,), name='close-lecture', daemon=True)
+        self.closing.append(thread)
+        thread.start()
+        return thread
+
+    def _close_lecture(self, session):
+        try:
+            if not self.attendance_writer.flush(timeout=5):
+                logging.warning(f"Marks for session {session.id} were still queued when it closed")
+            database.close_lecture_session(session.id)
+            logging.info(f"Closed session {session.id}")
+        except sqlite3.Error as e:
+            logging.error(f"Failed to close lecture session {session.id}: {str(e)}")
+        finally:
+            database.close_connection()
+        self.report_scheduler.flush()
+
+    def record_attendance(self, student_id, session):
+        """Queue one attendance mark; the outcome arrives later on attendance_writer.acks"""
+        return self.attendance_writer.submit(student_id, session)
+
+    def schedule_reports(self, marks):
+        """Mark the reports of newly recorded lectures dirty; runs on the writer thread"""
+        for date, lecture_num in {(mark.date, mark.lecture_number) for mark in marks}:
+            self.report_scheduler.request(date, lecture_num)
+
+    def generate_attendance_report(self, date, lecture_num):
+        """Generate a PDF report for the attendance"""
+        # Ensure reports directory exists
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        
+        # Get attendance data
+        records = database.get_lecture_attendance(date, lecture_num)
+        
+        if not records:
+            return  # No records to report
+        
+        # Create PDF filename
+        filename = os.path.join(REPORTS_DIR, f"attendance_{date}_lecture{lecture_num}.pdf")
+        
+        # Create PDF document
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+        from reportlab.lib import colors
+        
+        doc = SimpleDocTemplate(filename, pagesize=letter)
+        elements = []
+        styles = getSampleStyleSheet()
+        
+        # Title
+        title = Paragraph(f"Attendance Report - Lecture {lecture_num}", styles['Title'])
+        elements.append(title)
+        
+        # Report details
+        details = Paragraph(f"Date: {date}<br/>Total Students: {len(records)}", styles['Normal'])
+        elements.append(details)
+        
+        # Create table data
+        table_data = [["Student ID", "Name", "Time"]]  # Headers
+        
+        for record in records:
+            table_data.append(list(record))
+        
+        # Create table
+        table = Table(table_data)
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        
+        elements.append(table)
+        doc.build(elements)
+
+    def shutdown(self):
+        # Marks still in the queue are committed before the writer exits,
+        # then the reports they touched get their final build
+        for thread in self.closing:
+            thread.join(10)
+        self.attendance_writer.close()
+        self.report_scheduler.close()
+        self.snapshot_writer.close()
+        if self.recognition_pool:
+            self.recognition_pool.shutdown()
+            self.recognition_pool = None
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.metrics_dumper:
+            # Final snapshot, including the last writes and report builds
+            self.metrics_dumper.stop()
+            self.metrics_dumper = None
@@ -0,0 +1,82 @@
+import threading
+import time
+import logging
+
+
+class SnapshotWriter:
+    """Persists the gallery snapshot in the background, coalescing requests.
+
+    ``request()`` only marks the snapshot dirty; ``write`` runs ``delay``
+    seconds after the last request, so enrolling a whole class rewrites the
+    O(N) snapshot file once instead of once per student. Writes run one at
+    a time on a single worker thread, so two writers never race on the
+    file; a request that arrives during a write schedules another one
+    after it. ``close`` writes whatever is still dirty before stopping.
+    """
+
+    def __init__(self, write, delay=2.0):
+        self.write = write
+        self.delay = delay
+        self.writes = 0
+        self._due = None
+        self._writing = False
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='snapshot-writer', daemon=True)
+        self._thread.start()
+
+    def request(self):
+        with self._cond:
+            self._due = time.time() + self.delay
+            self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            if self._due is not None:
+                self._due = time.time()
+                self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """Block until no write is due or running; returns False on timeout"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._due is not None or self._writing:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def close(self, timeout=30.0):
+        """Write the snapshot if it is dirty, then stop the worker"""
+        self.flush()
+        self.wait(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next_due(self):
+        with self._cond:
+            while not self._closed:
+                if self._due is not None:
+                    if self._due <= time.time():
+                        self._due = None
+                        self._writing = True
+                        return True
+                    self._cond.wait(self._due - time.time())
+                else:
+                    self._cond.wait()
+            return False
+
+    def _run(self):
+        while self._next_due():
+            try:
+                self.write()
+                self.writes += 1
+            except Exception as e:
+                logging.error(f"Error saving gallery snapshot: {str(e)}")
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
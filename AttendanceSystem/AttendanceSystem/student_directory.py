@@ -0,0 +1,55 @@
+import threading
+from collections import namedtuple
+
+# Per-student metadata kept in memory next to the gallery. New fields go
+# here (and into database.get_student_metadata) rather than into new
+# per-recognition queries.
+StudentInfo = namedtuple('StudentInfo', ['name'])
+
+
+class StudentDirectory:
+    """In-memory student_id -> StudentInfo map used for labels and messages.
+
+    Loaded together with the gallery and updated by register/unregister,
+    so recognition never has to query SQLite for a name. Each entry is a
+    single small tuple, and lookups are plain dict reads that are safe
+    from any thread; writers only serialize among themselves.
+    """
+
+    def __init__(self, rows=()):
+        self._lock = threading.Lock()
+        self._info = {}
+        self.replace(rows)
+
+    def __len__(self):
+        return len(self._info)
+
+    def __contains__(self, student_id):
+        return student_id in self._info
+
+    def replace(self, rows):
+        """Load (student_id, name) rows, e.g. after a reload from the database"""
+        info = {str(student_id): StudentInfo(name) for student_id, name in rows}
+        with self._lock:
+            self._info = info
+
+    def set(self, student_id, name):
+        with self._lock:
+            self._info[str(student_id)] = StudentInfo(name)
+
+    def remove(self, student_id):
+        with self._lock:
+            return self._info.pop(str(student_id), None) is not None
+
+    def info(self, student_id):
+        return self._info.get(student_id)
+
+    def get(self, student_id, default=None):
+        """Name of a student, or default; lets the directory stand in for an id -> name dict"""
+        info = self._info.get(student_id)
+        return info.name if info else default
+
+    def label(self, student_id):
+        """'Name (ID)' for status messages, or the bare ID for unknown students"""
+        name = self.get(student_id)
+        return f"{name} ({student_id})" if name else str(student_id)
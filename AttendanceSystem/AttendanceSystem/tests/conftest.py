@@ -0,0 +1,17 @@
+import os
+import sys
+import pytest
+
+# The app is a flat folder of modules run from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def scratch_db(tmp_path, monkeypatch):
+    """Point database.py at a fresh, migrated file for the duration of a test"""
+    import database
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'attendance.db'))
+    database.close_connection()
+    database.init_db()
+    yield database
+    database.close_connection()
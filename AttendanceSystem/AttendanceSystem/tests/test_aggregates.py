@@ -0,0 +1,30 @@
+from attendance_writer import Mark
+
+
+def aggregates(conn):
+    return (conn.execute("SELECT date, lecture_number, count FROM lecture_counts ORDER BY 1, 2").fetchall(),
+            conn.execute("SELECT student_id, count FROM student_totals ORDER BY 1").fetchall())
+
+
+def test_triggers_match_a_full_recount(scratch_db):
+    first = scratch_db.open_lecture_session('2024-01-15')
+    second = scratch_db.open_lecture_session('2024-01-15')
+    marks = [Mark(sid, s.date, s.lecture_number, '2024-01-15 09:00:00', s.id)
+             for s in (first, second) for sid in ('S1', 'S2', 'S3')]
+    # The repeat is a no-op and must not be counted twice
+    scratch_db.insert_attendance(marks + marks[:1])
+    for student_id in ('S4', 'S1'):
+        scratch_db.add_student(student_id, student_id, f"{student_id}.npy")
+    scratch_db.delete_student('S2')
+    conn = scratch_db.get_connection()
+    with conn:
+        conn.execute("UPDATE attendance SET student_id='S4' WHERE student_id='S3' AND lecture_number=2")
+
+    maintained = aggregates(conn)
+    assert maintained == ([('2024-01-15', 1, 2), ('2024-01-15', 2, 2)], [('S1', 2), ('S3', 1), ('S4', 1)])
+    scratch_db.rebuild_aggregates()
+    assert aggregates(conn) == maintained
+
+    stats = scratch_db.get_statistics('2024-01-15')
+    assert stats.today_attendance == 3  # distinct students
+    assert [(a.student_id, a.count) for a in stats.top_attendees][0] == ('S1', 2)
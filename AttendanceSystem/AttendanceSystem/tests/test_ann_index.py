@@ -0,0 +1,73 @@
+import numpy as np
+from gallery import FaceGallery, GalleryStore, EMBEDDING_DIM
+from ann_index import IVFIndex
+
+STUDENTS = 2000
+
+
+def clustered_gallery(rng):
+    # Face embeddings form loose clusters rather than filling the space evenly
+    centres = rng.normal(size=(40, EMBEDDING_DIM))
+    encodings = centres[rng.integers(0, len(centres), STUDENTS)] + 0.3 * rng.normal(size=(STUDENTS, EMBEDDING_DIM))
+    return FaceGallery([f"S{i}" for i in range(STUDENTS)], encodings.astype(np.float32))
+
+
+def test_ivf_recall_against_exact_search():
+    rng = np.random.default_rng(6)
+    gallery = clustered_gallery(rng)
+    index = IVFIndex.build(gallery)
+    probes = gallery.encodings[rng.choice(STUDENTS, 200, replace=False)]
+    probes = probes + 0.05 * rng.normal(size=probes.shape).astype(np.float32)
+
+    exact = gallery.match(probes)
+    approx = index.match(gallery, probes)
+    recall = np.mean([a.index == e.index for a, e in zip(approx, exact)])
+    assert recall >= 0.95
+    for a, e in zip(approx, exact):
+        if a.index == e.index:
+            # The GEMM expansion loses a little float32 precision at short range
+            assert np.isclose(a.distance, e.distance, atol=1e-3)
+
+
+def test_rows_added_after_build_are_matched_exactly(tmp_path):
+    rng = np.random.default_rng(7)
+    store = GalleryStore(clustered_gallery(rng))
+    index = IVFIndex.build(store.snapshot)
+    newcomer = rng.normal(size=EMBEDDING_DIM).astype(np.float32)
+    store.add('NEW', newcomer)
+
+    assert index.covers(store.snapshot)
+    assert index.match(store.snapshot, [newcomer])[0].student_id == 'NEW'
+
+    path = str(tmp_path / 'gallery.ivf.npz')
+    index.save(path)
+    assert IVFIndex.load(path, store.snapshot) is not None
+    store.remove('S0')
+    assert not index.covers(store.snapshot)
+    assert IVFIndex.load(path, store.snapshot) is None
+
+
+def test_removal_drops_rows_without_rebuilding(tmp_path):
+    rng = np.random.default_rng(8)
+    store = GalleryStore(clustered_gallery(rng))
+    store.add('TWO', rng.normal(size=(2, EMBEDDING_DIM)).astype(np.float32))
+    index = IVFIndex.build(store.snapshot)
+    before = store.snapshot
+    i = before.ids().index('S10')
+    start, end = int(before.offsets[i]), int(before.offsets[i + 1])
+    store.remove('S10')
+
+    trimmed = index.without_rows(start, end, store.snapshot)
+    assert trimmed.size == index.size - 1
+    assert trimmed.covers(store.snapshot)
+    np.testing.assert_array_equal(trimmed.centroids, index.centroids)
+    # Every remaining row is still indexed exactly once, with its own code
+    assert sorted(trimmed.order) == list(range(store.snapshot.n_templates))
+    np.testing.assert_array_equal(trimmed.codes,
+                                  store.snapshot.encodings[trimmed.order].astype(np.float16))
+
+    probes = store.snapshot.encodings[[0, 500, -1]]
+    assert [m.student_id for m in trimmed.match(store.snapshot, probes)] == ['S0', 'S501', 'TWO']
+    path = str(tmp_path / 'gallery.ivf.npz')
+    trimmed.save(path)
+    assert IVFIndex.load(path, store.snapshot) is not None
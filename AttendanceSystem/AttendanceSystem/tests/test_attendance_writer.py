@@ -0,0 +1,48 @@
+import sqlite3
+from attendance_writer import AttendanceWriter
+
+
+def drain_acks(writer, count):
+    acks = []
+    while len(acks) < count:
+        acks.append(writer.acks.get(timeout=5))
+    return acks
+
+
+def test_duplicate_marks_are_ignored_and_acknowledged(scratch_db):
+    session = scratch_db.open_lecture_session('2024-01-15')
+    committed = []
+    writer = AttendanceWriter(batch_size=4, flush_interval=0.05, on_commit=committed.extend)
+    try:
+        for student_id in ['S1', 'S2', 'S1', 'S3', 'S2', 'S1']:
+            writer.submit(student_id, session)
+        assert writer.flush(timeout=5)
+        acks = drain_acks(writer, 6)
+    finally:
+        writer.close()
+
+    assert [(ack.mark.student_id, ack.inserted) for ack in acks] == [
+        ('S1', True), ('S2', True), ('S1', False), ('S3', True), ('S2', False), ('S1', False)]
+    assert all(ack.error is None for ack in acks)
+    assert sorted(mark.student_id for mark in committed) == ['S1', 'S2', 'S3']
+    rows = scratch_db.get_connection().execute(
+        "SELECT student_id, session_id FROM attendance ORDER BY student_id").fetchall()
+    assert rows == [('S1', session.id), ('S2', session.id), ('S3', session.id)]
+
+
+def test_failed_batch_is_acknowledged_with_the_error(scratch_db, monkeypatch):
+    session = scratch_db.open_lecture_session('2024-01-15')
+
+    def locked(marks):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(scratch_db, 'insert_attendance', locked)
+
+    writer = AttendanceWriter(flush_interval=0.05)
+    try:
+        writer.submit('S1', session)
+        assert writer.flush(timeout=5)
+        ack, = drain_acks(writer, 1)
+    finally:
+        writer.close()
+    assert not ack.inserted
+    assert 'locked' in ack.error
@@ -0,0 +1,36 @@
+import threading
+
+
+def test_add_students_reports_only_new_rows(scratch_db):
+    assert scratch_db.add_students([('S1', 'Ann', 'S1.npy'), ('S2', 'Ben', 'S2.npy')]) == [True, True]
+    assert scratch_db.add_students([('S2', 'Other', 'x.npy'), ('S3', 'Cat', 'S3.npy'),
+                                    ('S3', 'Dup', 'y.npy')]) == [False, True, False]
+    assert scratch_db.get_student_name('S2') == 'Ben'
+    assert [row[0] for row in scratch_db.get_student_encodings()] == ['S1', 'S2', 'S3']
+
+
+def test_concurrent_kiosks_get_different_lecture_numbers(scratch_db):
+    kiosks = 6
+    start = threading.Barrier(kiosks)
+    sessions = []
+    errors = []
+
+    def open_lecture(room):
+        # Each thread has its own connection, like a kiosk in its own process
+        try:
+            start.wait()
+            sessions.append(scratch_db.open_lecture_session('2024-01-01', room))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            scratch_db.close_connection()
+
+    threads = [threading.Thread(target=open_lecture, args=(f"Room {i}",)) for i in range(kiosks)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert errors == []
+    assert sorted(session.lecture_number for session in sessions) == list(range(1, kiosks + 1))
+    assert len({session.id for session in sessions}) == kiosks
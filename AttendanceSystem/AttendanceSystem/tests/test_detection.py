@@ -0,0 +1,114 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+from detection import FaceDetector, ConfirmedBackend, frame_boxes
+
+
+class BrightBackend:
+    """Stands in for HOG: every bright blob at least min_size pixels tall is a face"""
+
+    name = 'bright'
+
+    def __init__(self, min_size=1):
+        self.min_size = min_size
+        self.calls = []
+
+    def detect(self, image, upsample=1):
+        self.calls.append(image.shape[:2])
+        count, _, stats, _ = cv2.connectedComponentsWithStats((image.max(axis=2) > 200).astype(np.uint8))
+        return [(y, x + w, y + h, x) for x, y, w, h, _ in stats[1:count] if h >= self.min_size]
+
+
+class FixedBackend:
+    """Stands in for a cascade: always proposes the same boxes"""
+
+    name = 'fixed'
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def detect(self, image, upsample=1):
+        return list(self.boxes)
+
+
+def scene(*faces):
+    frame = np.full((240, 320, 3), 60, dtype=np.uint8)
+    for top, right, bottom, left in faces:
+        frame[top:bottom, left:right] = 255
+    return frame
+
+
+def detect(detector, frame):
+    prepared = detector.prepare(frame)
+    return frame_boxes(prepared, detector.locate(prepared))
+
+
+def assert_boxes_close(boxes, expected, tolerance=4):
+    assert len(boxes) == len(expected)
+    for box, want in zip(sorted(boxes), sorted(expected)):
+        assert np.abs(np.subtract(box, want)).max() <= tolerance, (box, want)
+
+
+def test_roi_crops_the_frame_and_maps_boxes_back():
+    backend = BrightBackend()
+    detector = FaceDetector(backend, scale=0.5, roi=(0.5, 0.25, 1.0, 1.0))
+    inside, outside = (100, 240, 140, 200), (100, 60, 140, 20)
+
+    prepared = detector.prepare(scene(inside, outside))
+    assert prepared.origin == (160, 60)
+    assert prepared.rgb.shape[:2] == (90, 80)
+    assert_boxes_close(frame_boxes(prepared, detector.locate(prepared)), [inside])
+    assert backend.calls == [(90, 80)]
+
+
+def test_polygon_roi_masks_faces_outside_it():
+    # Triangle over the right half: the top-left corner of its bounding box is masked out
+    detector = FaceDetector(BrightBackend(), scale=0.5, roi=[(0.5, 0.0), (1.0, 0.0), (1.0, 1.0)])
+    inside, masked = (20, 310, 60, 270), (180, 210, 220, 170)
+    assert_boxes_close(detect(detector, scene(inside, masked)), [inside])
+
+
+def test_coarse_to_fine_only_refines_candidates_and_motion():
+    fine = BrightBackend()
+    # Faces under 10 coarse pixels are too small for the coarse pass
+    coarse = BrightBackend(min_size=10)
+    detector = FaceDetector(fine, scale=0.5, coarse_scale=0.25, coarse_backend=coarse, refine_margin=0.5)
+    seated, walking_in = (40, 100, 100, 40), (160, 264, 184, 240)
+
+    # No motion background yet: the whole frame is refined
+    assert_boxes_close(detect(detector, scene(seated)), [seated])
+    assert fine.calls == [(120, 160)]
+
+    # Static scene: only the grown coarse candidate is refined
+    fine.calls.clear()
+    assert_boxes_close(detect(detector, scene(seated)), [seated])
+    (height, width), = fine.calls
+    assert height * width < 120 * 160 / 4
+
+    # A face too small for the coarse pass is still found where something moved
+    fine.calls.clear()
+    assert_boxes_close(detect(detector, scene(seated, walking_in)), [seated, walking_in])
+    assert len(fine.calls) == 2
+    assert sum(h * w for h, w in fine.calls) < 120 * 160 / 2
+    assert detector.last_pixels < 120 * 160 * 4
+
+
+def test_confirmed_backend_drops_unconfirmed_proposals():
+    face = (40, 100, 100, 40)
+    # One hit on the face, one on the empty wall
+    cascade = FixedBackend([(44, 96, 96, 44), (150, 300, 200, 250)])
+    hog = BrightBackend()
+    backend = ConfirmedBackend(cascade, hog, margin=0.25)
+    assert backend.name == 'fixed+bright'
+
+    rgb = cv2.cvtColor(scene(face), cv2.COLOR_BGR2RGB)
+    assert_boxes_close(backend.detect(rgb), [face], tolerance=0)
+    # HOG only looked inside the proposals, grown by a quarter on every side
+    assert sorted(hog.calls) == [(75, 75), (78, 78)]
+
+    hog.calls.clear()
+    assert ConfirmedBackend(FixedBackend([]), hog).detect(rgb) == []
+    assert hog.calls == []
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from gallery import FaceGallery, GalleryStore, EMBEDDING_DIM, students_digest, write_snapshot, load_snapshot
+from gallery import load_encoding_files
+
+
+def random_templates(rng, counts):
+    return [rng.normal(size=(k, EMBEDDING_DIM)).astype(np.float32) for k in counts]
+
+
+def brute_force(templates, probes):
+    """Per-student minimum Euclidean distance, one template at a time"""
+    return np.array([[min(np.linalg.norm(t - probe) for t in student) for student in templates]
+                     for probe in probes])
+
+
+@pytest.mark.parametrize('counts', [[1] * 7, [1, 3, 2, 5, 1]], ids=['single', 'multi-template'])
+def test_student_distances_match_brute_force(counts):
+    rng = np.random.default_rng(1)
+    templates = random_templates(rng, counts)
+    gallery = FaceGallery([f"S{i}" for i in range(len(counts))], templates)
+    probes = rng.normal(size=(4, EMBEDDING_DIM)).astype(np.float32)
+
+    expected = brute_force(templates, probes)
+    np.testing.assert_allclose(gallery.student_distances(probes), expected, rtol=1e-4)
+
+    for match, row in zip(gallery.match(probes), expected):
+        order = np.argsort(row)
+        assert match.index == order[0]
+        assert match.student_id == f"S{order[0]}"
+        assert match.distance == pytest.approx(row[order[0]], rel=1e-4)
+        assert match.margin == pytest.approx(row[order[1]] - row[order[0]], rel=1e-3)
+
+
+def test_match_edge_cases():
+    rng = np.random.default_rng(2)
+    probe = rng.normal(size=(1, EMBEDDING_DIM))
+    assert FaceGallery().match(np.empty((0, EMBEDDING_DIM))) == []
+    assert FaceGallery().match(probe)[0].index == -1
+
+    only = FaceGallery(['S0'], random_templates(rng, [2]))
+    assert only.match(probe)[0].student_id == 'S0'
+    assert only.match(probe)[0].margin == float('inf')
+
+
+def test_snapshot_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    gallery = FaceGallery(['S0', 'S1', 'S2'], random_templates(rng, [2, 1, 3]))
+    digest = students_digest([('S0', 'a.npy'), ('S1', 'b.npy'), ('S2', 'c.npy')])
+    path = str(tmp_path / 'gallery.snapshot')
+    write_snapshot(path, gallery, digest)
+
+    loaded = load_snapshot(path, digest)
+    assert loaded.ids() == ['S0', 'S1', 'S2']
+    np.testing.assert_array_equal(loaded.encodings, gallery.encodings)
+    np.testing.assert_array_equal(loaded.offsets, gallery.offsets)
+    # Built from another students table
+    assert load_snapshot(path, students_digest([('S0', 'a.npy')])) is None
+
+
+def test_corrupted_snapshot_is_rejected(tmp_path):
+    rng = np.random.default_rng(4)
+    path = str(tmp_path / 'gallery.snapshot')
+    write_snapshot(path, FaceGallery(['S0', 'S1'], random_templates(rng, [1, 1])))
+    with open(path, 'r+b') as f:
+        f.seek(-EMBEDDING_DIM, 2)
+        byte = f.read(1)
+        f.seek(-EMBEDDING_DIM, 2)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    assert load_snapshot(path) is None
+    assert load_snapshot(str(tmp_path / 'missing.snapshot')) is None
+
+
+def test_store_snapshots_are_isolated():
+    rng = np.random.default_rng(5)
+    store = GalleryStore(FaceGallery(['S0', 'S1'], random_templates(rng, [1, 2])))
+    before = store.snapshot
+    encodings = before.encodings.copy()
+
+    store.add('S2', random_templates(rng, [2])[0])
+    grown = store.snapshot
+    # Re-enrolling moves S0 to the end with new templates
+    store.add('S0', random_templates(rng, [1])[0])
+    store.remove('S1')
+
+    assert before.ids() == ['S0', 'S1']
+    np.testing.assert_array_equal(before.encodings, encodings)
+    assert grown.ids() == ['S0', 'S1', 'S2']
+    np.testing.assert_array_equal(grown.encodings[:3], encodings)
+    assert store.snapshot.ids() == ['S2', 'S0']
+    assert 'S1' not in store and len(store) == 2
+    assert not store.remove('S1')
+
+    probe = store.snapshot.encodings[-1]
+    assert store.snapshot.match([probe])[0].student_id == 'S0'
+    assert before.match([probe])[0].distance > 0
+
+
+def test_load_encoding_files_skips_missing_students(tmp_path):
+    rng = np.random.default_rng(9)
+    single, stack = random_templates(rng, [1, 3])
+    np.save(tmp_path / 'S0.npy', single[0])
+    np.save(tmp_path / 'S1.npy', stack)
+    gallery = load_encoding_files([('S0', str(tmp_path / 'S0.npy')), ('S2', str(tmp_path / 'S2.npy')),
+                                   ('S1', str(tmp_path / 'S1.npy'))])
+    assert gallery.ids() == ['S0', 'S1']
+    assert list(gallery.offsets) == [0, 1, 4]
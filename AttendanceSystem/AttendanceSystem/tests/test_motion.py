@@ -0,0 +1,29 @@
+import numpy as np
+from motion import MotionGate
+
+
+def scene(box=None):
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    if box:
+        top, right, bottom, left = box
+        frame[top:bottom, left:right] = 230
+    return frame
+
+
+def test_gate_opens_on_motion_and_closes_after_hold():
+    gate = MotionGate(hold=1.0)
+    assert gate.check(scene(), now=0)
+    assert gate.check(scene(), now=0.5)
+    assert not gate.check(scene(), now=2.0)
+    assert gate.check(scene((100, 140, 180, 60)), now=3.0)
+
+
+def test_changed_regions_cover_the_moving_area():
+    gate = MotionGate()
+    assert gate.changed_regions(scene()) is None
+    assert gate.changed_regions(scene()) == []
+
+    (top, right, bottom, left), = gate.changed_regions(scene((100, 140, 180, 60)))
+    # In frame pixels, around the blob, grown a little by the dilation
+    assert top <= 100 and right >= 140 and bottom >= 180 and left <= 60
+    assert bottom - top < 120 and right - left < 120
@@ -0,0 +1,70 @@
+import cv2
+import numpy as np
+import pytest
+from camera import open_capture, is_live
+from pipeline import ScanPipeline
+
+FRAMES = 24
+# Green level that tells the two fixture videos apart
+SOURCE_MARKS = {'door_a.avi': 200, 'door_b.avi': 60}
+
+
+def write_video(path, mark, frames=FRAMES):
+    """Flat frames whose blue level encodes the frame index and green level the source"""
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(frames):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        frame[..., 0] = 8 * i + 4
+        frame[..., 1] = mark
+        writer.write(frame)
+    writer.release()
+
+
+def decode(frame):
+    """Recognizer stand-in: ['source:index'] read back from the frame colour"""
+    index = int(frame[..., 0].mean()) // 8
+    source = min(SOURCE_MARKS, key=lambda name: abs(SOURCE_MARKS[name] - frame[..., 1].mean()))
+    return [f"{source}:{index}"]
+
+
+@pytest.fixture
+def videos(tmp_path):
+    paths = {}
+    for name, mark in SOURCE_MARKS.items():
+        write_video(tmp_path / name, mark)
+        paths[name] = str(tmp_path / name)
+    return paths
+
+
+def test_two_pipelines_keep_order_and_source(videos):
+    pipelines = {}
+    for name, path in videos.items():
+        capture = open_capture(path)
+        assert capture is not None and not is_live(path)
+        pipelines[name] = ScanPipeline(capture, decode, max_fps=0, gate=None, realtime=False)
+    for pipeline in pipelines.values():
+        pipeline.start()
+
+    results = {name: [] for name in pipelines}
+    try:
+        while not all(p.finished.is_set() and len(p.results) == 0 for p in pipelines.values()):
+            for name, pipeline in pipelines.items():
+                result = pipeline.results.get(timeout=0.05)
+                if result is not None:
+                    results[name].append(result)
+    finally:
+        for pipeline in pipelines.values():
+            pipeline.stop()
+
+    for name, received in results.items():
+        # Recorded video drops nothing: every frame, in capture order
+        assert [result.seq for result in received] == list(range(1, FRAMES + 1))
+        for result in received:
+            assert result.faces == [f"{name}:{result.seq - 1}"]
+
+
+def test_only_local_files_are_replayed(videos):
+    assert not is_live(videos['door_a.avi'])
+    assert is_live(0) and is_live('1')
+    assert is_live('rtsp://10.0.0.5:554/stream1')
+    assert is_live('http://camera.local/video.mjpg')
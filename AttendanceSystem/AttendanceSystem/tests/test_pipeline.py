@@ -0,0 +1,51 @@
+import random
+import time
+import cv2
+import numpy as np
+from motion import MotionGate
+from pipeline import ReorderBuffer, ScanPipeline
+
+
+def test_reorder_buffer_holds_results_behind_a_gap():
+    reorder = ReorderBuffer()
+    assert reorder.push(1, 'b') == []
+    assert reorder.push(3, 'd') == []
+    assert reorder.push(0, 'a') == ['a', 'b']
+    assert reorder.push(2, 'c') == ['c', 'd']
+    assert reorder.push(5, 'f') == []
+    assert reorder.push(4, 'e') == ['e', 'f']
+
+
+def test_reorder_buffer_releases_every_ticket_once_in_order():
+    tickets = list(range(200))
+    random.Random(8).shuffle(tickets)
+    reorder = ReorderBuffer()
+    released = []
+    for ticket in tickets:
+        released.extend(reorder.push(ticket, ticket))
+    assert released == list(range(200))
+
+
+def test_static_video_is_gated_on_video_time_without_throttling(tmp_path):
+    path = str(tmp_path / 'static.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (64, 48))
+    for _ in range(90):
+        writer.write(np.full((48, 64, 3), 90, np.uint8))
+    writer.release()
+
+    # Idle after 0.1 s; on wall-clock time every later frame would wait 1 s
+    gate = MotionGate(hold=0.5, idle_timeout=0.1, idle_poll_interval=1.0)
+    pipeline = ScanPipeline(cv2.VideoCapture(path), lambda image: [], max_fps=0, gate=gate, realtime=False)
+    recognized = []
+    start = time.time()
+    pipeline.start()
+    while not (pipeline.finished.is_set() and len(pipeline.results) == 0) and time.time() - start < 10:
+        result = pipeline.results.get(timeout=0.1)
+        if result is not None:
+            recognized.append(result.seq)
+    pipeline.stop()
+
+    assert time.time() - start < 5
+    # The first frame opens the gate, which holds for 0.5 s of video (15 frames)
+    assert len(recognized) == 15
+    assert pipeline.skipped == 75
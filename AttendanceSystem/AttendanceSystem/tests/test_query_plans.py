@@ -0,0 +1,102 @@
+import sqlite3
+import pytest
+import database
+from migrations import migrate, schema_version, SCHEMA_VERSION
+
+# Schema written by the top-level attendance_system.py before migrations
+LEGACY_SCHEMA = [
+    '''CREATE TABLE students (student_id TEXT PRIMARY KEY, name TEXT NOT NULL,
+                              face_encoding_path TEXT NOT NULL)''',
+    '''CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT, date TEXT,
+                                lecture_number INTEGER, timestamp TEXT)''',
+    "CREATE TABLE admins (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE, password TEXT)",
+    "INSERT INTO admins (username, password) VALUES ('admin', 'x')",
+    "INSERT INTO students VALUES ('s1', 'One', 's1.npy')",
+    "INSERT INTO attendance (student_id, date, lecture_number, timestamp) VALUES ('s1', '2024-01-01', 1, '09:00')",
+    # The legacy schema allowed duplicate marks
+    "INSERT INTO attendance (student_id, date, lecture_number, timestamp) VALUES ('s1', '2024-01-01', 1, '09:05')",
+]
+
+# Schema written by database.init_db before migrations
+NESTED_SCHEMA = [
+    '''CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+                              student_id TEXT UNIQUE, face_encoding_path TEXT)''',
+    '''CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT, date DATE,
+                                lecture_number INTEGER, timestamp DATETIME,
+                                UNIQUE(student_id, date, lecture_number))''',
+    "CREATE TABLE admins (username TEXT PRIMARY KEY, password TEXT)",
+    "CREATE INDEX idx_attendance_student_id ON attendance(student_id)",
+    "CREATE INDEX idx_attendance_date ON attendance(date)",
+    "CREATE INDEX idx_attendance_lecture ON attendance(lecture_number)",
+    "INSERT INTO students (name, student_id, face_encoding_path) VALUES ('One', 's1', 's1.npy')",
+    "INSERT INTO attendance (student_id, date, lecture_number, timestamp) VALUES ('s1', '2024-01-01', 1, '09:00')",
+]
+
+EXPECTED_INDEXES = {
+    'idx_attendance_lecture_report',
+    'idx_attendance_student_history',
+    'idx_attendance_session',
+    'idx_student_totals_count',
+}
+
+
+def _indexes(conn):
+    return {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_autoindex%'")}
+
+
+def _database(path, statements):
+    conn = sqlite3.connect(path)
+    for sql in statements:
+        conn.execute(sql)
+    conn.commit()
+    return conn
+
+
+@pytest.mark.parametrize('statements', [LEGACY_SCHEMA, NESTED_SCHEMA, []], ids=['legacy', 'nested', 'empty'])
+def test_migrates_to_current_schema(tmp_path, statements):
+    conn = _database(str(tmp_path / 'attendance.db'), statements)
+    assert schema_version(conn) == 0
+
+    assert migrate(conn) == [1, 2, 3, 4]
+    assert schema_version(conn) == SCHEMA_VERSION == 4
+    assert _indexes(conn) == EXPECTED_INDEXES
+    assert conn.execute("SELECT 1 FROM admins WHERE username='admin'").fetchone()
+    if statements:
+        # One mark per student per lecture, attached to a lecture session
+        assert conn.execute("SELECT COUNT(*), COUNT(session_id) FROM attendance").fetchone() == (1, 1)
+        assert conn.execute("SELECT count FROM student_totals WHERE student_id='s1'").fetchone() == (1,)
+    conn.close()
+
+
+def test_migrate_is_idempotent(tmp_path):
+    path = str(tmp_path / 'attendance.db')
+    conn = _database(path, NESTED_SCHEMA)
+    migrate(conn)
+    schema = sorted(conn.execute("SELECT type, name, sql FROM sqlite_master"))
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    assert migrate(conn) == []
+    assert sorted(conn.execute("SELECT type, name, sql FROM sqlite_master")) == schema
+    assert conn.execute("SELECT COUNT(*) FROM attendance").fetchone() == (1,)
+    conn.close()
+
+
+@pytest.mark.parametrize('name', sorted(database.HOT_QUERIES))
+def test_hot_query_uses_an_index(tmp_path, name):
+    conn = sqlite3.connect(str(tmp_path / 'attendance.db'))
+    migrate(conn)
+    sql, params = database.HOT_QUERIES[name]
+    steps = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    conn.close()
+
+    if name in database.INDEX_ORDERED_QUERIES:
+        # Top-N queries may walk an index in order, but never sort
+        assert not [step for step in steps if 'TEMP B-TREE' in step], steps
+    else:
+        assert not [step for step in steps if step.startswith('SCAN')], steps
+
+
+def test_check_query_plans_reports_nothing(scratch_db):
+    assert scratch_db.check_query_plans() == {}
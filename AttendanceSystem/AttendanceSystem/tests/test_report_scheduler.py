@@ -0,0 +1,56 @@
+import time
+from report_scheduler import ReportScheduler
+
+
+def test_requests_coalesce_per_lecture():
+    built = []
+    scheduler = ReportScheduler(lambda date, lecture: built.append((date, lecture)), delay=0.05)
+    for _ in range(20):
+        scheduler.request('2024-01-01', 1)
+        scheduler.request('2024-01-01', 2)
+    assert scheduler.wait(timeout=5)
+    assert sorted(built) == [('2024-01-01', 1), ('2024-01-01', 2)]
+    assert scheduler.builds == 2 and scheduler.pending == 0
+    scheduler.close()
+
+
+def test_steady_arrivals_still_rebuild_after_max_wait():
+    built = []
+    scheduler = ReportScheduler(lambda date, lecture: built.append(time.time()), delay=0.2, max_wait=0.3)
+    start = time.time()
+    # Every request comes before the debounce runs out
+    while time.time() - start < 1.0:
+        scheduler.request('2024-01-01', 1)
+        time.sleep(0.05)
+    assert built and built[0] - start < 0.6
+    scheduler.close(timeout=5)
+    assert 2 <= len(built) <= 5
+
+
+def test_close_builds_dirty_reports_without_waiting_for_the_delay():
+    built = []
+    scheduler = ReportScheduler(lambda date, lecture: built.append(lecture), delay=60)
+    scheduler.request('2024-01-01', 3)
+    start = time.time()
+    scheduler.close(timeout=5)
+    assert built == [3]
+    assert time.time() - start < 2
+    assert not scheduler._thread.is_alive()
+
+
+def test_a_failing_build_does_not_stop_the_worker():
+    built = []
+
+    def build(date, lecture):
+        if lecture == 1:
+            raise OSError("disk full")
+        built.append(lecture)
+
+    scheduler = ReportScheduler(build, delay=0.01)
+    scheduler.request('2024-01-01', 1)
+    assert scheduler.wait(timeout=5)
+    assert scheduler.builds == 0 and scheduler.pending == 0
+
+    scheduler.request('2024-01-01', 2)
+    scheduler.close(timeout=5)
+    assert built == [2] and scheduler.builds == 1
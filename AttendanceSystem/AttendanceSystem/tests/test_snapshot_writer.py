@@ -0,0 +1,41 @@
+import threading
+import time
+from snapshot_writer import SnapshotWriter
+
+
+def test_requests_coalesce_into_one_write_at_a_time():
+    active = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def write():
+        with lock:
+            active.append(1)
+            overlaps.append(len(active) > 1)
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+
+    writer = SnapshotWriter(write, delay=0.05)
+    for _ in range(50):
+        writer.request()
+    assert writer.wait(timeout=5)
+    assert writer.writes == 1
+
+    # A request during a write schedules exactly one more, never a parallel one
+    writer.request()
+    time.sleep(0.07)
+    writer.request()
+    writer.request()
+    writer.close()
+    assert writer.writes == 3
+    assert not any(overlaps)
+
+
+def test_close_writes_a_dirty_snapshot_without_waiting_for_the_delay():
+    calls = []
+    writer = SnapshotWriter(lambda: calls.append(time.time()), delay=60)
+    writer.request()
+    start = time.time()
+    writer.close(timeout=5)
+    assert len(calls) == 1 and calls[0] - start < 1
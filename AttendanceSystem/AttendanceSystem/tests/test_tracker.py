@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+
+import tracker
+from tracker import FaceTracker, TrackingRecognizer, iou_matrix
+from detection import DetectionFrame
+from gallery import Match
+from scanner import CameraSession
+
+
+def test_iou_matrix():
+    iou = iou_matrix([(0, 10, 10, 0)], [(0, 10, 10, 0), (5, 15, 15, 5), (20, 30, 30, 20)])
+    np.testing.assert_allclose(iou, [[1.0, 25 / 175, 0.0]], rtol=1e-5)
+
+
+def test_detections_follow_their_tracks():
+    faces = FaceTracker(iou_threshold=0.3)
+    (a, b), to_encode = faces.update([(0, 50, 50, 0), (0, 250, 50, 200)], now=0)
+    assert to_encode == [0, 1]
+    faces.verify(a, 'S1', 0.3, now=0)
+    faces.verify(b, 'S2', 0.4, now=0)
+
+    # Both faces moved a little and the detector listed them in the other order
+    tracks, to_encode = faces.update([(4, 254, 54, 204), (4, 54, 54, 4)], now=0.1)
+    assert tracks == [b, a]
+    assert to_encode == []
+    assert a.box == (4, 54, 54, 4)
+
+    # A box that overlaps nothing starts a new, unverified track
+    tracks, to_encode = faces.update([(4, 54, 54, 4), (300, 400, 400, 300)], now=0.2)
+    assert tracks[0] is a
+    assert tracks[1].track_id not in (a.track_id, b.track_id) and tracks[1].student_id is None
+    assert to_encode == [1]
+
+
+def test_tracks_expire_after_max_age():
+    faces = FaceTracker(max_age=1.0)
+    (track,), _ = faces.update([(0, 50, 50, 0)], now=0)
+    faces.verify(track, 'S1', 0.3, now=0)
+
+    faces.update([], now=0.5)
+    assert faces.tracks == [track]
+    faces.update([], now=1.5)
+    assert faces.tracks == []
+
+    (again,), to_encode = faces.update([(0, 50, 50, 0)], now=1.6)
+    assert again.track_id != track.track_id and again.student_id is None
+    assert to_encode == [0]
+
+
+class ScriptedDetector:
+    """Returns the next list of face locations on every frame"""
+
+    def __init__(self, frames):
+        self.frames = iter(frames)
+
+    def prepare(self, frame):
+        return DetectionFrame(frame, (0, 0), 1.0)
+
+    def locate(self, prepared):
+        return next(self.frames)
+
+
+def test_a_tracked_face_is_matched_and_marked_once(monkeypatch):
+    monkeypatch.setattr(tracker.face_recognition, 'face_encodings',
+                        lambda rgb, locations: [np.zeros(128) for _ in locations])
+    matched = []
+
+    def match_faces(encodings):
+        matched.append(len(encodings))
+        return [Match(0, 'S1', 0.3, float('inf')) for _ in encodings]
+
+    frames = [[(10 + i, 60 + i, 60 + i, 10 + i)] for i in range(5)]
+    recognize = TrackingRecognizer(match_faces, ScriptedDetector(frames), tolerance=0.5,
+                                   tracker=FaceTracker(reverify_interval=60.0))
+    session = CameraSession(0, None, None)
+    image = np.zeros((120, 160, 3), dtype=np.uint8)
+    results, arrivals = [], []
+    for _ in frames:
+        faces = recognize(image)
+        results.extend(faces)
+        arrivals.extend(session.new_arrivals(faces))
+
+    assert matched == [1]
+    assert {(face.student_id, face.track_id) for face in results} == {('S1', results[0].track_id)}
+    assert [face.student_id for face in arrivals] == ['S1']
@@ -0,0 +1,129 @@
+import time
+import itertools
+import numpy as np
+import face_recognition
+from config import MATCH_TOLERANCE
+from recognition import FaceResult
+from detection import frame_boxes
+import metrics
+
+
+class Track:
+    """A face followed across frames, with the identity it was last verified as."""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.distance = float('inf')
+        self.last_seen = now
+        self.last_verified = None
+
+    def needs_encoding(self, now, reverify_interval, unknown_retry):
+        if self.last_verified is None:
+            return True
+        interval = reverify_interval if self.student_id else unknown_retry
+        return now - self.last_verified >= interval
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU between two lists of (top, right, bottom, left) boxes."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+class FaceTracker:
+    """Greedy IoU tracker that carries identities from frame to frame."""
+
+    def __init__(self, iou_threshold=0.3, max_age=1.0, reverify_interval=5.0, unknown_retry=1.0):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.reverify_interval = reverify_interval
+        self.unknown_retry = unknown_retry
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes, now=None):
+        """Associate detections with tracks.
+
+        Returns the track for every box and the indices of the boxes whose
+        faces must be encoded (new tracks and tracks due for re-verification).
+        """
+        now = time.time() if now is None else now
+        assigned = [None] * len(boxes)
+        if self.tracks and boxes:
+            iou = iou_matrix([t.box for t in self.tracks], boxes)
+            used_tracks = set()
+            # Highest overlap first so each track keeps its closest detection
+            for flat in np.argsort(-iou, axis=None):
+                ti, di = divmod(int(flat), len(boxes))
+                if iou[ti, di] < self.iou_threshold:
+                    break
+                if ti in used_tracks or assigned[di] is not None:
+                    continue
+                used_tracks.add(ti)
+                assigned[di] = self.tracks[ti]
+
+        for i, box in enumerate(boxes):
+            if assigned[i] is None:
+                track = Track(next(self._ids), box, now)
+                self.tracks.append(track)
+                assigned[i] = track
+            else:
+                assigned[i].box = box
+                assigned[i].last_seen = now
+
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+        to_encode = [i for i, track in enumerate(assigned)
+                     if track.needs_encoding(now, self.reverify_interval, self.unknown_retry)]
+        return assigned, to_encode
+
+    def verify(self, track, student_id, distance, now=None):
+        track.student_id = student_id
+        track.distance = distance
+        track.last_verified = time.time() if now is None else now
+
+
+class TrackingRecognizer:
+    """Recognition stage that only encodes faces it cannot vouch for.
+
+    HOG detection still runs on every processed frame, but the 128-d
+    encoding and gallery match only run for new tracks and for tracks
+    due for periodic re-verification.
+    """
+
+    def __init__(self, match_faces, detector, tolerance=MATCH_TOLERANCE, tracker=None):
+        self.match_faces = match_faces
+        self.detector = detector
+        self.tolerance = tolerance
+        self.tracker = tracker or FaceTracker()
+
+    def __call__(self, frame):
+        now = time.time()
+        prepared = self.detector.prepare(frame)
+        face_locations = self.detector.locate(prepared)
+        metrics.count('faces_detected', len(face_locations))
+        boxes = frame_boxes(prepared, face_locations)
+
+        tracks, to_encode = self.tracker.update(boxes, now)
+        metrics.count('faces_tracked', len(tracks) - len(to_encode))
+        if to_encode:
+            with metrics.timer('encoding'):
+                face_encodings = face_recognition.face_encodings(
+                    prepared.rgb, [face_locations[i] for i in to_encode])
+            for i, match in zip(to_encode, self.match_faces(face_encodings)):
+                recognized = match.student_id is not None and match.distance <= self.tolerance
+                if not recognized:
+                    metrics.count('faces_unknown')
+                self.tracker.verify(tracks[i], match.student_id if recognized else None, match.distance, now)
+
+        return [FaceResult(track.box, track.student_id, track.distance, track.track_id) for track in tracks]
@@ -5,6 +5,8 @@ import cv2
 import face_recognition
 import numpy as np
 import os
+import time
+import threading
 from datetime import datetime
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -28,6 +30,12 @@ class AdminPanel:
         self.capture_active = False
         self.face_encoding = None
         self.temp_student_data = {}
+        self.last_detection = None  # (rgb frame, face locations) of the latest preview detection
+        # Newest preview frame for the detection thread, which runs HOG off
+        # the Tk thread at most 4 times a second on a half-size copy
+        self.preview_frame = None
+        self.preview_lock = threading.Lock()
+        self.preview_stopped = threading.Event()
         
         self.create_widgets()
         self.load_students()
@@ -44,6 +52,7 @@ class AdminPanel:
 
     def cleanup(self):
         self.capture_active = False
+        self.preview_stopped.set()
         if self.video_capture and self.video_capture.isOpened():
             self.video_capture.release()
         self.window.destroy()
@@ -172,9 +181,36 @@ class AdminPanel:
 
         self.video_capture.set(3, 640)  # Width
         self.video_capture.set(4, 480)  # Height
+        self.last_detection = None
+        self.preview_frame = None
+        self.preview_stopped = threading.Event()
+        threading.Thread(target=self.detect_preview_faces, args=(self.preview_stopped,), daemon=True).start()
+        self.capture_window.protocol("WM_DELETE_WINDOW", self.close_capture_window)
         self.capture_active = True
         self.update_preview()
 
+    def close_capture_window(self):
+        self.cleanup_camera()
+        self.capture_window.destroy()
+
+    def detect_preview_faces(self, stopped):
+        while not stopped.is_set():
+            with self.preview_lock:
+                rgb_frame, self.preview_frame = self.preview_frame, None
+            if rgb_frame is None:
+                stopped.wait(0.02)
+                continue
+            started = time.time()
+            try:
+                small_frame = cv2.resize(rgb_frame, (0, 0), fx=0.5, fy=0.5)
+                face_locations = [tuple(v * 2 for v in location)
+                                  for location in face_recognition.face_locations(small_frame)]
+            except Exception as e:
+                logging.error(f"Preview detection error: {str(e)}")
+                face_locations = []
+            self.last_detection = (rgb_frame, face_locations)
+            stopped.wait(max(0.0, 0.25 - (time.time() - started)))
+
     def update_preview(self):
         if self.capture_active and self.video_capture.isOpened():
             ret, frame = self.video_capture.read()
@@ -190,14 +226,18 @@ class AdminPanel:
                 self.video_label.after(10, self.update_preview)
                 return
 
-            # Draw face detection rectangle if any faces are found
-            face_locations = face_recognition.face_locations(rgb_frame)
-            for (top, right, bottom, left) in face_locations:
-                cv2.rectangle(rgb_frame, (left, top), (right, bottom), (0, 255, 0), 2)
+            # Hand the frame to the detection thread; the preview keeps
+            # drawing the latest boxes until it has a newer result
+            with self.preview_lock:
+                self.preview_frame = rgb_frame.copy()
+
+            detection = self.last_detection
+            if detection is not None:
+                for (top, right, bottom, left) in detection[1]:
+                    cv2.rectangle(rgb_frame, (left, top), (right, bottom), (0, 255, 0), 2)
             
             try:
-                rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(rgb_image)
+                img = Image.fromarray(rgb_frame)
 
             except Exception as img_err:
                 logging.error(f"Pillow conversion error: {img_err}")
@@ -214,24 +254,13 @@ class AdminPanel:
             self.capture_status.config(text="Camera not available", fg="red")
             return
 
-        ret, frame = self.video_capture.read()
-        if not ret or frame is None:
-            self.capture_status.config(text="Error capturing frame", fg="red")
-            return
-
-        if frame.dtype != np.uint8:
-            frame = frame.astype(np.uint8)
-        try:
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        except Exception as conv_err:
-            self.capture_status.config(text=f"Conversion error: {conv_err}", fg="red")
+        # Reuse the frame and faces the preview last detected
+        if self.last_detection is None:
+            self.capture_status.config(text="Waiting for face detection, try again", fg="red")
             return
+        rgb_frame, face_locations = self.last_detection
         
         try:
-            face_locations = face_recognition.face_locations(
-                rgb_frame, model="hog", number_of_times_to_upsample=2
-            )
-            
             if len(face_locations) != 1:
                 error_msg = "No face detected" if len(face_locations) == 0 else "Multiple faces detected"
                 raise ValueError(error_msg)
@@ -280,6 +309,7 @@ class AdminPanel:
 
     def cleanup_camera(self):
         self.capture_active = False
+        self.preview_stopped.set()
         if self.video_capture and self.video_capture.isOpened():
             self.video_capture.release()
         self.face_encoding = None
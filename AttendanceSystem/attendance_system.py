@@ -5,6 +5,7 @@ import face_recognition
 import numpy as np
 from PIL import Image, ImageTk
 import os
+import sys
 import sqlite3
 from datetime import datetime
 import time
@@ -36,40 +37,18 @@ logging.basicConfig(
 )
 
 # Database Initialization
+# The schema and its upgrades are owned by the app in AttendanceSystem/; its
+# migrations also bring databases created by this script up to date
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'AttendanceSystem'))
+from migrations import migrate
+
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute('''CREATE TABLE IF NOT EXISTS students (
-        student_id TEXT PRIMARY KEY,
-        name TEXT NOT NULL,
-        face_encoding_path TEXT NOT NULL
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id TEXT,
-        date TEXT,
-        lecture_number INTEGER,
-        timestamp TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS admins (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT
-    )''')
-
-    # Add default admin if none exists
-    c.execute("SELECT COUNT(*) FROM admins")
-    if c.fetchone()[0] == 0:
-        default_username = "admin"
-        default_password = hashlib.sha256("admin123".encode()).hexdigest()
-        c.execute("INSERT INTO admins (username, password) VALUES (?, ?)",
-                  (default_username, default_password))
-
-    conn.commit()
-    conn.close()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
 
 class AttendanceSystem:
     def __init__(self):
@@ -116,9 +95,10 @@ class AttendanceSystem:
             self.known_student_ids = []
             for student_id, encoding_path in students:
                 if os.path.exists(encoding_path):
-                    encoding = np.load(encoding_path)
-                    self.known_encodings.append(encoding)
-                    self.known_student_ids.append(student_id)
+                    # One row per template; the closest template wins in update_scan
+                    for encoding in np.load(encoding_path).reshape(-1, 128):
+                        self.known_encodings.append(encoding)
+                        self.known_student_ids.append(student_id)
             logging.info(f"Loaded {len(self.known_encodings)} face encodings")
         except Exception as e:
             logging.error(f"Error loading encodings cache: {str(e)}")
@@ -230,15 +210,14 @@ class AttendanceSystem:
                 messagebox.showerror("Error", "No face detected")
                 return
 
-            # Average encodings
-            avg_encoding = np.mean(encodings, axis=0)
+            # Keep every sample as a template instead of averaging them
             encoding_path = os.path.join(FACE_ENCODINGS_DIR, f"{student_id}.npy")
-            np.save(encoding_path, avg_encoding)
+            np.save(encoding_path, np.stack(encodings))
 
             try:
                 conn = sqlite3.connect(DB_PATH)
                 c = conn.cursor()
-                c.execute("INSERT INTO students VALUES (?, ?, ?)",
+                c.execute("INSERT INTO students (student_id, name, face_encoding_path) VALUES (?, ?, ?)",
                           (student_id, name, encoding_path))
                 conn.commit()
                 conn.close()
@@ -364,13 +343,16 @@ class AttendanceSystem:
                 # Draw rectangle around face
                 cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
 
-                # Compare with known faces
-                matches = face_recognition.compare_faces(self.known_encodings, face_encoding)
+                # Compare with known faces; take the closest match, not the first
+                face_distances = face_recognition.face_distance(self.known_encodings, face_encoding)
                 name = "Unknown"
+                # A reload can leave the gallery empty while the scan is running
+                if len(face_distances) == 0:
+                    continue
+                best_match_index = int(np.argmin(face_distances))
 
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    student_id = self.known_student_ids[first_match_index]
+                if face_distances[best_match_index] <= 0.6:
+                    student_id = self.known_student_ids[best_match_index]
                     name = self.get_student_name(student_id)
                     self.status_label.config(text=f"Recognized: {name} ({student_id})", fg="green")
                     self.mark_attendance(student_id)